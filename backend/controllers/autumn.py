@@ -1,20 +1,17 @@
 from blacksheep import json, Request
 from blacksheep.server.controllers import APIController, get, post, put, delete
+import hashlib
 from services.autumn_service import AutumnService
+from services.billing_service import PRODUCT_CREDITS, BillingService
 from services.supabase_service import SupabaseService
 from utils.env import settings
 import json as pyjson
 
-# Map product IDs to credit amounts
-PRODUCT_CREDITS = {
-    "starter-pack": 500,
-    "pro-pack": 2000,
-}
-
 class Autumn(APIController):
-    def __init__(self, autumn_service: AutumnService, supabase_service: SupabaseService):
+    def __init__(self, autumn_service: AutumnService, supabase_service: SupabaseService, billing_service: BillingService):
         self.autumn_service = autumn_service
         self.supabase_service = supabase_service
+        self.billing_service = billing_service
 
     async def _get_customer_id(self, request: Request) -> str:
         """Extract customer_id from request (auth header, session, etc.)"""
@@ -34,7 +31,10 @@ class Autumn(APIController):
     async def autumn_webhook(self, request: Request):
         """
         Handle Autumn payment webhooks.
-        Called by Autumn when a payment succeeds.
+        Called by Autumn when a payment succeeds. Repeated deliveries are dropped before any
+        database call and credits are granted in the background, so Autumn gets its answer fast.
+        The payload only says which customer to look at: what is granted comes from the customer's
+        paid purchases on Autumn, each applied once.
         """
         try:
             body = await request.json()
@@ -60,17 +60,17 @@ class Autumn(APIController):
                 print(f"Unknown product_id: {product_id}")
                 return json({"error": "Unknown product"}, status=400)
             
-            # Update user's credits
-            self.supabase_service.add_user_credits(customer_id, credits)
-            
-            # Update user's plan to paid
-            self.supabase_service.update_user_plan(customer_id, "paid")
+            # Redeliveries carry the same event id; payloads without one are keyed by their content
+            event_id = body.get("id") or body.get("event_id") or hashlib.sha256(
+                pyjson.dumps(body, sort_keys=True).encode()
+            ).hexdigest()
+            if not await self.billing_service.claim_event(event_id):
+                print(f"Duplicate webhook event {event_id}, ignoring")
+                return json({"status": "duplicate"}, status=200)
             
-            # Log the transaction
-            self.supabase_service.log_credit_purchase(customer_id, credits, product_id)
-            
-            print(f"Successfully processed payment for user {customer_id}: +{credits} credits")
-            return json({"status": "success"}, status=200)
+            # Add credits, set the plan to paid and log the purchase, once per paid purchase
+            self.billing_service.grant_purchase_later(event_id, customer_id, product_id)
+            return json({"status": "accepted"}, status=200)
             
         except Exception as e:
             import traceback
@@ -144,34 +144,22 @@ class Autumn(APIController):
             if credits == 0:
                 return json({"error": f"Unknown product: {product_id}"}, status=400)
             
-            # SECURITY: Verify the purchase with Autumn before adding credits
-            product_verified = await self.autumn_service.check_product_purchased(user_id, product_id)
-            print(f"Product verification for {product_id}: {product_verified}")
-            
-            if not product_verified:
+            # SECURITY: only purchases Autumn lists as paid are granted, each of them once,
+            # so reloading the redirect or a webhook that got there first adds nothing
+            new_balance, credits_added, error = await self.billing_service.grant_purchases(user_id, product_id)
+            if error == "no_paid_purchase":
                 return json({
                     "error": "Payment not verified. Please complete checkout.",
                     "verified": False
                 }, status=402)
+            if error:
+                return json({"error": "Failed to apply credits"}, status=500)
             
-            # Add credits to Supabase
-            self.supabase_service.add_user_credits(user_id, credits)
-            
-            # Update user's plan to paid
-            self.supabase_service.update_user_plan(user_id, "paid")
-            
-            # Log the transaction
-            self.supabase_service.log_credit_purchase(user_id, credits, product_id)
-            
-            # Get updated balance
-            user_row = self.supabase_service.get_user_row(user_id)
-            new_balance = user_row.data.get("credits", 0) if user_row and user_row.data else 0
-            
-            print(f"Successfully added {credits} credits for user {user_id}. New balance: {new_balance}")
+            print(f"Added {credits_added} credits for user {user_id}. New balance: {new_balance}")
             
             return json({
                 "success": True,
-                "credits_added": credits,
+                "credits_added": credits_added,
                 "new_balance": new_balance
             }, status=200)
             
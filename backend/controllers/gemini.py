@@ -1,46 +1,62 @@
 from blacksheep import json, Request
-from blacksheep.server.controllers import APIController, post
+from blacksheep.server.controllers import APIController, get, post
 import json as pyjson
 
 from services.vertex_service import VertexService
 from services.supabase_service import SupabaseService
+from services.vertex_rate_limiter import PRIORITY_FREE, PRIORITY_PAID, VertexRateLimitError, request_priority
+from services.gemini_cache_service import GeminiCacheService
+from utils.env import settings
+from utils.multipart import UploadTooLargeError, read_multipart
 
 class Gemini(APIController):
     
-    def __init__(self, vertex_service: VertexService, supabase_service: SupabaseService):
+    def __init__(self, vertex_service: VertexService, supabase_service: SupabaseService, gemini_cache_service: GeminiCacheService):
         self.vertex_service = vertex_service
         self.supabase_service = supabase_service
+        self.gemini_cache_service = gemini_cache_service
+
+    @get("/cache/stats")
+    async def cache_stats(self):
+        """Hit/miss counters of the Gemini result cache"""
+        return json(self.gemini_cache_service.stats())
+
+    async def _set_priority(self, user_id):
+        """Queue this request's Vertex calls ahead of free users' when the user is on the paid plan"""
+        paid = bool(user_id) and await self.supabase_service.is_paid_user(user_id)
+        request_priority.set(PRIORITY_PAID if paid else PRIORITY_FREE)
 
     @post("/extract-context")
     async def extract_context(self, request: Request):
         try:
-            # Parse multipart form data manually
-            files = await request.files()
-            
-            if not files:
-                return json({"error": "No video file provided"}, status=400)
-            
-            video_data = files[0]
-            
-            
-            prompt = (
-                "Extract structured scene information from this video.\n"
-                "Respond with ONLY valid JSON. No explanations, no markdown, no backticks.\n"
-                "Follow this exact structure, keys required:\n"
-                "{\n"
-                '  "entities": [\n'
-                '    { "id": "id-1", "description": "...", "appearance": "..." }\n'
-                "  ],\n"
-                '  "environment": "...",\n'
-                '  "style": "..."\n'
-                "}\n"
-                "If information is missing, use empty strings.\n"
-            )
-            #use vertex service to analyze video
-            res = self.vertex_service.analyze_video_content(
-                prompt=prompt,
-                video_data=video_data
-            )
+            await self._set_priority(request.scope.get("user_id"))
+
+            # Parse multipart form data as it streams in, the video is spooled to disk past a small threshold
+            async with read_multipart(request, settings.UPLOAD_MAX_VIDEO_BYTES) as form:
+                if not form.files:
+                    return json({"error": "No video file provided"}, status=400)
+                
+                video_data = form.files[0]
+                
+                
+                prompt = (
+                    "Extract structured scene information from this video.\n"
+                    "Respond with ONLY valid JSON. No explanations, no markdown, no backticks.\n"
+                    "Follow this exact structure, keys required:\n"
+                    "{\n"
+                    '  "entities": [\n'
+                    '    { "id": "id-1", "description": "...", "appearance": "..." }\n'
+                    "  ],\n"
+                    '  "environment": "...",\n'
+                    '  "style": "..."\n'
+                    "}\n"
+                    "If information is missing, use empty strings.\n"
+                )
+                #use vertex service to analyze video
+                res = await self.vertex_service.analyze_video_content(
+                    prompt=prompt,
+                    video=video_data
+                )
 
             raw = res.text or res.candidates[0].content.parts[0].text
 
@@ -60,6 +76,10 @@ class Gemini(APIController):
                 return json({"error": "Failed to parse JSON", "raw": raw}, status=500)
 
 
+        except UploadTooLargeError as e:
+            return json({"error": str(e)}, status=413)
+        except VertexRateLimitError as e:
+            return json({"error": str(e)}, status=503)
         except Exception as e:
             print(f"ERROR in extract_context: {e}")
             import traceback
@@ -70,19 +90,18 @@ class Gemini(APIController):
     async def generate_image(self, request: Request):
         try:
             # get user token
-            user_id = request.scope.get("user_id") or self.supabase_service.get_user_id_from_request(request)
+            user_id = request.scope.get("user_id") or await self.supabase_service.get_user_id_from_request(request)
             if not user_id:
                 return json({"error": "Unauthorized"}, status=401)
 
-            files = await request.files()
-            
-            if not files:
-                return json({"error": "No image file provided"}, status=400)
-            
-            image_data = files[0]
+            async with read_multipart(request, settings.UPLOAD_MAX_IMAGE_BYTES) as form:
+                if not form.files:
+                    return json({"error": "No image file provided"}, status=400)
+                
+                image_data = await form.files[0].read()
 
             # Check and deduct credits BEFORE generating
-            success, error = self.supabase_service.do_transaction(
+            success, error = await self.supabase_service.do_transaction(
                 user_id=user_id,
                 transaction_type="image_gen",
                 credit_usage=1 # TODO: adjust number later
@@ -93,15 +112,20 @@ class Gemini(APIController):
                     return json({"error": "You don't have enough credits. Please purchase more credits to continue."}, status=402)
                 return json({"error": "Transaction failed"}, status=500)
 
+            await self._set_priority(user_id)
             prompt = "Improve the attached image and fill in any missing details (There may be annotations and stuff but don't remove them or follow them, treat them like they dont exist unless they explicitly say to do so). Do not deviate from the original art style too much, simply understand the artist's idea and enhance it a bit."
 
             res = await self.vertex_service.generate_image_content(
                 prompt=prompt,
-                image=image_data.data
+                image=image_data
             )
 
             return json({"image_bytes": res})
             
+        except UploadTooLargeError as e:
+            return json({"error": str(e)}, status=413)
+        except VertexRateLimitError as e:
+            return json({"error": str(e)}, status=503)
         except Exception as e:
             print(f"ERROR in generate_image: {e}")
             import traceback
@@ -1,9 +1,50 @@
-from blacksheep import json, Response, Request, FromForm
-from blacksheep.server.controllers import APIController, post, get
+from typing import Optional
+from blacksheep import json, Response, Request, WebSocket
+from blacksheep.server.controllers import APIController, post, get, ws
+from blacksheep.server.sse import ServerSentEvent, ServerSentEventsResponse
+from blacksheep.server.websocket import WebSocketDisconnectError
 from services.supabase_service import SupabaseService
-from models.job import JobStatus, VideoJobRequest, VideoGenerationInput
+from models.job import JobStatus, VideoJob, VideoJobRequest, VideoGenerationInput
 from services.job_service import JobService
-from services.video_merge_service import VideoMergeService
+from services.video_merge_service import VideoMergeService, MergeQueueFullError
+from utils.env import settings
+from utils.multipart import MultipartForm, UploadTooLargeError, read_multipart
+
+def _job_event_payload(job: VideoJob) -> dict:
+    """Shape of a job state event, shared by the SSE and WebSocket streams"""
+    return {
+        "status": job["state"],
+        "job_start_time": job.get("job_start_time"),
+        "job_end_time": job.get("job_end_time"),
+        "video_url": job.get("video_url"),
+        "error_message": job.get("error"),
+        "metadata": job.get("metadata"),
+    }
+
+def _job_status_payload(status: JobStatus) -> dict:
+    """Body of a job status response, shared by the single and batch endpoints"""
+    if status.status == "error":
+        return {"status": "error", "error_message": status.error}
+    if status.status == "waiting":
+        return {"status": "waiting", "job_start_time": status.job_start_time.isoformat()}
+    return {
+        "status": status.status,
+        "job_start_time": status.job_start_time.isoformat(),
+        "job_end_time": status.job_end_time.isoformat() if status.job_end_time else None,
+        "video_url": status.video_url,
+        "metadata": status.metadata
+    }
+
+def _generation_input(form: MultipartForm) -> Optional[VideoGenerationInput]:
+    """Form fields of a video job, None when a required one is missing"""
+    try:
+        return VideoGenerationInput(
+            custom_prompt=form.fields["custom_prompt"],
+            global_context=form.fields["global_context"],
+            duration_seconds=int(form.fields.get("duration_seconds", 6)),
+        )
+    except (KeyError, ValueError):
+        return None
 
 class Jobs(APIController):
     def __init__(self, job_service: JobService, supabase_service: SupabaseService, video_merge_service: VideoMergeService):
@@ -12,45 +53,62 @@ class Jobs(APIController):
         self.video_merge_service = video_merge_service
 
     @post("/video")
-    async def add_video_job(self, request: Request, input: FromForm[VideoGenerationInput]):
+    async def add_video_job(self, request: Request):
         """
         Starts a video generation job.
-        Input: starting image (file), context, any other user-prompt
+        Input: starting image (file), optional ending image (file), context, any other user-prompt
         Return: jobId
         """
-        user_id = request.scope.get("user_id") or self.supabase_service.get_user_id_from_request(request)
+        user_id = request.scope.get("user_id") or await self.supabase_service.get_user_id_from_request(request)
         if not user_id:
             return json({"error": "Unauthorized"}, status=401)
 
-        # FromForm parses the body, so request.files should be populated if multipart
-        # request.files is a method that returns the list of files
-        files = await request.files()
-        
-        if not files:
-            return json({"error": "No image file provided"}, status=400)
+        # the body is parsed as it streams in, oversized images are refused before they are fully read
+        try:
+            async with read_multipart(request, settings.UPLOAD_MAX_IMAGE_BYTES, max_files=2) as form:
+                input = _generation_input(form)
+                if input is None:
+                    return json({"error": "custom_prompt and global_context are required"}, status=400)
+                if not form.files:
+                    return json({"error": "No image file provided"}, status=400)
 
-        image_file = files[0]
-        ending_image_file = files[1] if len(files) > 1 else None
-        
-        data = VideoJobRequest(
-            starting_image=image_file.data,
-            ending_image=ending_image_file.data if ending_image_file else None,
-            global_context=input.value.global_context,
-            custom_prompt=input.value.custom_prompt
-        )
+                image_file = form.files[0]
+                ending_image_file = form.files[1] if len(form.files) > 1 else None
 
-        success, error = self.supabase_service.do_transaction(
-            user_id=user_id,
-            transaction_type="video_gen",
-            credit_usage=10 # TODO: adjust number later
-        )
-        
-        if not success:
-            if error == "insufficient_credits":
-                return json({"error": "You don't have enough credits. Please purchase more credits to continue."}, status=402)
-            return json({"error": "Transaction failed"}, status=500)
-        
-        job_id = await self.job_service.create_video_job(data)
+                data = VideoJobRequest(
+                    starting_image=await image_file.read(),
+                    ending_image=await ending_image_file.read() if ending_image_file else None,
+                    global_context=input.global_context,
+                    custom_prompt=input.custom_prompt
+                )
+        except UploadTooLargeError as e:
+            return json({"error": str(e)}, status=413)
+
+        # identical submissions share the in-flight job or reuse its finished video, and are not charged again
+        claim = await self.job_service.claim_video_job(data, user_id)
+        if claim.coalesced:
+            return json({"job_id": claim.job_id, "coalesced": True})
+        try:
+            # paid users' jobs are served first when Vertex quota is short
+            data.paid = await self.supabase_service.is_paid_user(user_id)
+
+            success, error = await self.supabase_service.do_transaction(
+                user_id=user_id,
+                transaction_type="video_gen",
+                credit_usage=10 # TODO: adjust number later
+            )
+            
+            if not success:
+                await self.job_service.release_video_job(claim, "Transaction failed")
+                if error == "insufficient_credits":
+                    return json({"error": "You don't have enough credits. Please purchase more credits to continue."}, status=402)
+                return json({"error": "Transaction failed"}, status=500)
+            
+            job_id = await self.job_service.create_video_job(claim, data)
+        except BaseException:
+            # cancelled or failed before the job was queued, don't leave duplicates attached to it
+            await self.job_service.release_video_job(claim, "Job could not be started")
+            raise
         return json({"job_id": job_id})
 
     @get("/video/{job_id}")
@@ -64,48 +122,87 @@ class Jobs(APIController):
             return json({"error": "Job not found"}, status=404)
 
         if jobStatus.status == "error":
-            return json({
-                "status": "error",
-                "error_message": jobStatus.error
-            }, status=500)
+            return json(_job_status_payload(jobStatus), status=500)
         
         if jobStatus.status == "waiting":
-            return json({
-                "status": "waiting",
-                "job_start_time": jobStatus.job_start_time.isoformat()
-            }, status=202)
+            return json(_job_status_payload(jobStatus), status=202)
         
+        return json(_job_status_payload(jobStatus), status=200)
+
+    @post("/video/status")
+    async def get_video_job_statuses(self, request: Request):
+        """
+        Status of many jobs at once, for boards with lots of pending scenes.
+        Input: JSON body with "job_ids" array
+        Return: {"jobs": {job_id: status}}, same shape as GET /video/{job_id}; unknown jobs get status "not_found"
+        """
+        try:
+            body = await request.json()
+        except Exception:
+            body = None
+        job_ids = body.get("job_ids") if isinstance(body, dict) else None
+        if not isinstance(job_ids, list) or not all(isinstance(job_id, str) for job_id in job_ids):
+            return json({"error": "job_ids array is required"}, status=400)
+        if len(job_ids) > settings.JOB_STATUS_BATCH_MAX:
+            return json({"error": f"At most {settings.JOB_STATUS_BATCH_MAX} job ids per request"}, status=400)
+
+        statuses = await self.job_service.get_video_job_statuses(job_ids)
         return json({
-            "status": jobStatus.status,
-            "job_start_time": jobStatus.job_start_time.isoformat(),
-            "job_end_time": jobStatus.job_end_time.isoformat() if jobStatus.job_end_time else None,
-            "video_url": jobStatus.video_url,
-            "metadata": jobStatus.metadata
-        }, status=200)
+            "jobs": {
+                job_id: _job_status_payload(status) if status else {"status": "not_found", "error_message": "Job not found"}
+                for job_id, status in statuses.items()
+            }
+        })
+
+    @get("/video/{job_id}/events")
+    async def stream_video_job_events(self, job_id: str):
+        """
+        Streams job state transitions as Server-Sent Events:
+        pending -> analyzing -> generating -> done/error. The stream ends after done/error.
+        """
+        if not await self.job_service.get_video_job_status(job_id):
+            return json({"error": "Job not found"}, status=404)
+
+        async def events():
+            async for job in self.job_service.watch_video_job(job_id):
+                if job is None:
+                    yield ServerSentEvent(None, comment="keep-alive")
+                else:
+                    yield ServerSentEvent(_job_event_payload(job), event=job["state"])
+
+        return ServerSentEventsResponse(events)
+
+    @ws("/video/{job_id}/ws")
+    async def video_job_websocket(self, websocket: WebSocket, job_id: str):
+        """Same as /video/{job_id}/events over a WebSocket, one JSON message per state change"""
+        await websocket.accept()
+        try:
+            async for job in self.job_service.watch_video_job(job_id):
+                if job is not None:
+                    await websocket.send_json(_job_event_payload(job))
+            await websocket.close()
+        except WebSocketDisconnectError:
+            pass
 
     # DEV MOCK ENDPOINTS
     @post("/video/mock")
-    async def add_video_job_mock(self, request: Request, input: FromForm[VideoGenerationInput]):
+    async def add_video_job_mock(self, request: Request):
 
-        user_id = request.scope.get("user_id") or self.supabase_service.get_user_id_from_request(request)
+        user_id = request.scope.get("user_id") or await self.supabase_service.get_user_id_from_request(request)
         if not user_id:
             return json({"error": "Unauthorized"}, status=401)
         
         # validate input
-        files = await request.files()
-        
-        if not files:
-            return json({"error": "No image file provided"}, status=400)
-
-        image_file = files[0]
-        
-        data = VideoJobRequest(
-            starting_image=image_file.data,
-            global_context=input.value.global_context,
-            custom_prompt=input.value.custom_prompt
-        )
+        try:
+            async with read_multipart(request, settings.UPLOAD_MAX_IMAGE_BYTES, max_files=2) as form:
+                if _generation_input(form) is None:
+                    return json({"error": "custom_prompt and global_context are required"}, status=400)
+                if not form.files:
+                    return json({"error": "No image file provided"}, status=400)
+        except UploadTooLargeError as e:
+            return json({"error": str(e)}, status=413)
 
-        success, error = self.supabase_service.do_transaction(
+        success, error = await self.supabase_service.do_transaction(
             user_id=user_id,
             transaction_type="video_gen",
             credit_usage=10 # TODO: adjust number later
@@ -136,6 +233,14 @@ class Jobs(APIController):
         else:
             return Response(500)
     
+    @get("/video/merge/stats")
+    async def merge_stats(self):
+        """Concurrency, queue depth and wait time of the ffmpeg merge scheduler, plus segment cache hits"""
+        return json({
+            **self.video_merge_service.scheduler.stats(),
+            "segment_cache": self.video_merge_service.segment_cache_service.stats(),
+        })
+
     @post("/video/merge")
     async def merge_videos(self, request: Request):
         """
@@ -143,7 +248,7 @@ class Jobs(APIController):
         Input: JSON body with "video_urls" array (ordered from root to end frame)
         Return: merged video URL
         """     
-        user_id = request.scope.get("user_id") or self.supabase_service.get_user_id_from_request(request)
+        user_id = request.scope.get("user_id") or await self.supabase_service.get_user_id_from_request(request)
         if not user_id:
             return json({"error": "Unauthorized"}, status=401)
         
@@ -160,6 +265,10 @@ class Jobs(APIController):
             merged_video_url = await self.video_merge_service.merge_videos(video_urls, user_id)
             
             return json({"video_url": merged_video_url})
+        except MergeQueueFullError as e:
+            response = json({"error": str(e)}, status=e.status)
+            response.add_header(b"Retry-After", b"10")
+            return response
         except Exception as e:
             import traceback
             traceback.print_exc()
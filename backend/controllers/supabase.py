@@ -11,11 +11,11 @@ class Supabase(APIController):
     @get("/user")
     async def get_user_row(self, request: Request):
         try:
-            user_id = request.scope.get("user_id") or self.supabase_service.get_user_id_from_request(request)
+            user_id = request.scope.get("user_id") or await self.supabase_service.get_user_id_from_request(request)
             if not user_id:
                 return json({"error": "Unauthorized"}, status=401)
             
-            res = self.supabase_service.get_user_row(user_id=user_id)
+            res = await self.supabase_service.get_user_row(user_id=user_id)
 
             if not res or not res.data:
                 return json({"error": "Row not found"}, status=404)
@@ -29,11 +29,11 @@ class Supabase(APIController):
     @get("/transactions")
     async def get_transaction_log(self, request: Request):
         try:
-            user_id = request.scope.get("user_id") or self.supabase_service.get_user_id_from_request(request)
+            user_id = request.scope.get("user_id") or await self.supabase_service.get_user_id_from_request(request)
             if not user_id:
                 return json({"error": "Unauthorized"}, status=401)
             
-            res = self.supabase_service.get_transaction_log(user_id=user_id)
+            res = await self.supabase_service.get_transaction_log(user_id=user_id)
 
             if not res or not res.data:
                 return json([])
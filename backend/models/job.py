@@ -15,19 +15,33 @@ class VideoJobRequest:
     custom_prompt: str
     duration_seconds: int = 6
     ending_image: Optional[bytes] = None
+    paid: bool = False  # submitted by a paid user, their Vertex calls go first
+
+@dataclass
+class VideoJobClaim:
+    """A job id reserved for a request, coalesced when it points at an identical in-flight or finished job"""
+    job_id: str
+    fingerprint: Optional[str] = None
+    coalesced: bool = False
 
 @dataclass
 class JobStatus:
-    job_start_time: datetime
+    job_start_time: Optional[datetime]
     status: Optional[Literal["done", "waiting", "error"]]
     job_end_time: Optional[datetime] = None
     video_url: Optional[str] = None
     error: Optional[str] = None
     metadata: Optional[dict] = None
 
-class VideoJob(TypedDict):
-    """Type hint for video job stored in Redis"""
-    job_id: str
-    operation_name: str
+class VideoJob(TypedDict, total=False):
+    """Type hint for the video job hash stored in Redis (jobs:{job_id})"""
+    state: Literal["pending", "analyzing", "generating", "done", "error"]
     job_start_time: str  # ISO format datetime string
+    job_end_time: str
+    operation_name: str  # set once the Veo operation is submitted
+    poll_delay: str  # current poller backoff in seconds
+    attempts: str  # deliveries to a worker so far
+    fingerprint: str  # hash of the request, see JobService.claim_video_job
+    video_url: str
+    error: str
     metadata: dict
@@ -0,0 +1,57 @@
+"""
+Shared helpers for the backend benchmarks.
+
+The benchmarks run against stubbed upstreams, so only the settings need to
+be filled in before any service module is imported.
+"""
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+for key, value in {
+    "GOOGLE_CLOUD_PROJECT": "bench-project",
+    "GOOGLE_CLOUD_LOCATION": "us-central1",
+    "GOOGLE_GENAI_USE_VERTEXAI": "true",
+    "GOOGLE_CLOUD_BUCKET_NAME": "bench-bucket",
+    "REDIS_URL": "redis://localhost:6379/0",
+    "SUPABASE_URL": "https://bench.supabase.co",
+    "SUPABASE_SECRET_KEY": "bench",
+    "AUTUMN_SECRET_KEY": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+async def measure_concurrency(make_call, concurrency: int) -> dict:
+    """
+    Run one call on its own, then `concurrency` overlapping calls.
+    Returns the single-call latency, the overlapped wall time and the
+    wall time we would see if the calls were serialized by the event loop.
+    """
+    start = time.perf_counter()
+    await make_call(0)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(make_call(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "single_s": single,
+        "wall_s": wall,
+        "serialized_s": single * concurrency,
+        "overlap_ratio": wall / single if single else 0.0,
+    }
+
+
+def print_result(name: str, result: dict):
+    print(
+        f"{name}: n={result['concurrency']} single={result['single_s'] * 1000:.1f}ms "
+        f"wall={result['wall_s'] * 1000:.1f}ms serialized={result['serialized_s'] * 1000:.1f}ms "
+        f"wall/single={result['overlap_ratio']:.2f}"
+    )
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for the job record codec.
+
+Compares the legacy lzma+pickle format against utils/codec.py on a
+representative job record: encode time, decode time and bytes per job.
+
+Usage (from backend/):
+    python scripts/bench/job_codec.py --iterations 20000
+"""
+import argparse
+import lzma
+import pickle
+import timeit
+from datetime import datetime
+
+import _common  # noqa: F401  (sets up sys.path and settings)
+
+from utils import codec
+
+SAMPLE_JOB = {
+    "job_id": "0b8f6a52-8f0e-4d7e-9d55-3a1c4f0e2b7d",
+    "operation_name": "projects/bench-project/locations/us-central1/publishers/google/models/"
+                      "veo-3.1-fast-generate-001/operations/1234567890123456789",
+    "job_start_time": datetime(2025, 1, 1, 12, 0, 0).isoformat(),
+    "metadata": {
+        "annotation_description": (
+            "A red arrow points from the character on the left towards the door on the right, "
+            "indicating the character should walk to the door. A circled note near the window "
+            "says 'rain starts here', so rain should begin once the character reaches the door."
+        ),
+    },
+}
+
+
+def legacy_encode(data: dict) -> bytes:
+    return lzma.compress(pickle.dumps(data))
+
+
+def legacy_decode(data: bytes) -> dict:
+    return pickle.loads(lzma.decompress(data))
+
+
+def run(name: str, encode, decode, iterations: int):
+    encoded = encode(SAMPLE_JOB)
+    assert decode(encoded) == SAMPLE_JOB
+    encode_s = timeit.timeit(lambda: encode(SAMPLE_JOB), number=iterations)
+    decode_s = timeit.timeit(lambda: decode(encoded), number=iterations)
+    print(
+        f"{name:>14}: {len(encoded):5d} bytes/job  "
+        f"encode={encode_s / iterations * 1e6:8.2f}us  decode={decode_s / iterations * 1e6:8.2f}us"
+    )
+
+
+def main(iterations: int):
+    json_size = len(codec.JsonCodec().dumps(SAMPLE_JOB))
+    print(f"sample job: {json_size} bytes of JSON, zstd available: {codec.zstandard is not None}")
+    run("lzma+pickle", legacy_encode, legacy_decode, iterations)
+    run("codec", codec.encode, codec.decode, iterations)
+    if codec.zstandard is not None:
+        # what the codec does for records above CODEC_ZSTD_THRESHOLD
+        zstd = codec.ZstdJsonCodec()
+        run(
+            "codec(zstd)",
+            lambda data: bytes([zstd.version]) + zstd.dumps(data),
+            codec.decode,
+            iterations,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.iterations)
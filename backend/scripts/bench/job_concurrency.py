@@ -0,0 +1,85 @@
+"""
+Concurrency benchmark for JobService._process_video_job.
+
+Runs N overlapping jobs against a stubbed Gemini/Veo client whose calls take
+a fixed amount of time. If nothing blocks the event loop, N jobs finish in
+roughly the time of one job (max), not N times that (sum).
+
+Usage (from backend/):
+    python scripts/bench/job_concurrency.py --jobs 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import _common  # noqa: F401  (sets up sys.path and settings)
+
+import fakeredis
+
+from models.job import VideoJobRequest
+from services.job_service import JobService
+from services.redis_service import RedisService
+from services.storage_service import StorageService
+from services.job_queue_service import JobQueueService
+from services.vertex_service import VertexService
+from services.vertex_rate_limiter import VertexRateLimiter
+from services.gemini_cache_service import GeminiCacheService
+from utils.env import settings
+
+
+class StubModels:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        part = SimpleNamespace(text="a bouncing ball", inline_data=SimpleNamespace(data=b"\x89PNG clean"))
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+    async def generate_videos(self, model, prompt, image, config):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(name=f"operations/{uuid.uuid4()}")
+
+
+class StubClient:
+    def __init__(self, latency: float):
+        self.aio = SimpleNamespace(models=StubModels(latency))
+
+
+async def main(jobs: int, latency: float):
+    redis_service = RedisService()
+    redis_service.client = fakeredis.FakeAsyncRedis()
+    # every job uses the same images, keep the Gemini cache out of the measurement
+    settings.GEMINI_CACHE_ENABLED = False
+    # measure the job pipeline, not the quota or image resizing (the stub images aren't real images)
+    settings.VERTEX_RATE_LIMIT_ENABLED = False
+    settings.IMAGE_NORMALIZE_ENABLED = False
+    # the stage caps would queue the 20 jobs on purpose, which isn't the event loop blocking
+    settings.JOB_GEMINI_STAGE_CONCURRENCY = 0
+    settings.JOB_VEO_STAGE_CONCURRENCY = 0
+
+    vertex_service = VertexService(GeminiCacheService(redis_service), StorageService(), VertexRateLimiter(redis_service))
+    vertex_service.client = StubClient(latency)
+    job_service = JobService(vertex_service, redis_service, JobQueueService(redis_service))
+
+    request = VideoJobRequest(
+        starting_image=b"\x89PNG start",
+        ending_image=b"\x89PNG end",
+        global_context="a cartoon",
+        custom_prompt="the ball bounces",
+    )
+
+    async def run_job(_):
+        await job_service._process_video_job(str(uuid.uuid4()), request)
+
+    result = await _common.measure_concurrency(run_job, jobs)
+    _common.print_result("_process_video_job", result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per stubbed model call")
+    args = parser.parse_args()
+    asyncio.run(main(args.jobs, args.latency))
@@ -0,0 +1,75 @@
+"""
+Concurrency benchmark for SupabaseService.do_transaction.
+
+Runs N overlapping credit transactions against a stubbed PostgREST whose
+responses take a fixed amount of time, once through SupabaseService (async
+client) and once through the sync supabase-py client called from the event
+loop, which is how the service used to work. The sync numbers serialize,
+the async ones overlap.
+
+Usage (from backend/):
+    python scripts/bench/supabase_concurrency.py --calls 20 --latency 0.1
+"""
+import argparse
+import asyncio
+import time
+
+import _common  # noqa: F401  (sets up sys.path and settings)
+
+import httpx
+from supabase import AsyncClientOptions, ClientOptions, acreate_client, create_client
+
+from services.supabase_service import SupabaseService
+from utils.env import settings
+
+
+def stub_response(request: httpx.Request) -> httpx.Response:
+    # rpc returns the new balance, inserts return the inserted rows
+    if "/rpc/" in request.url.path:
+        return httpx.Response(200, json=90)
+    return httpx.Response(201, json=[{}])
+
+
+async def main(calls: int, latency: float):
+    async def async_handler(request):
+        await asyncio.sleep(latency)
+        return stub_response(request)
+
+    def sync_handler(request):
+        time.sleep(latency)
+        return stub_response(request)
+
+    service = SupabaseService()
+    service.supabase = await acreate_client(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_SECRET_KEY,
+        options=AsyncClientOptions(httpx_client=httpx.AsyncClient(transport=httpx.MockTransport(async_handler))),
+    )
+
+    async def async_call(i):
+        success, error = await service.do_transaction(f"user-{i}", "video_gen", 10)
+        assert success, error
+
+    result = await _common.measure_concurrency(async_call, calls)
+    _common.print_result("do_transaction (async client)", result)
+
+    sync_client = create_client(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_SECRET_KEY,
+        options=ClientOptions(httpx_client=httpx.Client(transport=httpx.MockTransport(sync_handler))),
+    )
+
+    async def sync_call(i):
+        sync_client.rpc("sub_user_credits", {"p_user_id": f"user-{i}", "p_credit_change": 10}).execute()
+        sync_client.table("transaction_log").insert({"user_id": f"user-{i}"}).execute()
+
+    result = await _common.measure_concurrency(sync_call, calls)
+    _common.print_result("do_transaction (sync client)", result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per stubbed PostgREST request")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.latency))
@@ -50,4 +50,76 @@ END;
 $$ LANGUAGE plpgsql security definer;
 CREATE TRIGGER on_auth_user_created
   AFTER INSERT ON auth.users
-  FOR EACH ROW EXECUTE PROCEDURE public.handle_new_user();
\ No newline at end of file
+  FOR EACH ROW EXECUTE PROCEDURE public.handle_new_user();
+
+-- debit credits and log the transaction in one round trip (and one transaction)
+CREATE OR REPLACE FUNCTION public.debit_user_credits(
+  p_user_id uuid,
+  p_transaction_type transaction_type,
+  p_credit_usage numeric
+)
+RETURNS numeric
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance numeric;
+BEGIN
+  -- raises insufficient_credits / user_not_found, rolling back the whole call
+  v_balance := public.sub_user_credits(p_user_id, p_credit_usage);
+
+  INSERT INTO public.transaction_log (transaction_type, user_id, credit_usage)
+  VALUES (p_transaction_type, p_user_id, p_credit_usage);
+
+  RETURN v_balance;
+END;
+$$;
+
+-- add purchased credits, switch the user to the paid plan and log the purchase
+-- p_purchase_id is Autumn's id of the paid purchase (invoice id + product), each one is applied once;
+-- purchases paid before billing_rollout.purchases_since were granted by the old flow and are never applied.
+-- Returns the balance and whether this call applied it (false for a purchase that was already granted)
+DROP FUNCTION IF EXISTS public.apply_credit_purchase(uuid, numeric, text);
+DROP FUNCTION IF EXISTS public.apply_credit_purchase(uuid, numeric, text, timestamptz);
+CREATE FUNCTION public.apply_credit_purchase(
+  p_user_id uuid,
+  p_credits numeric,
+  p_purchase_id text,
+  p_paid_at timestamptz
+)
+RETURNS TABLE (balance numeric, applied boolean)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance numeric;
+  v_inserted boolean := false;
+BEGIN
+  IF p_paid_at >= (SELECT purchases_since FROM public.billing_rollout) THEN
+    INSERT INTO public.applied_purchases (purchase_id, user_id)
+    VALUES (p_purchase_id, p_user_id)
+    ON CONFLICT (purchase_id) DO NOTHING;
+    v_inserted := FOUND;
+  END IF;
+
+  IF NOT v_inserted THEN
+    SELECT credits INTO v_balance FROM public.profiles WHERE user_id = p_user_id;
+    RETURN QUERY SELECT COALESCE(v_balance, 0), false;
+    RETURN;
+  END IF;
+
+  -- a negative change adds credits
+  v_balance := public.sub_user_credits(p_user_id, -p_credits);
+
+  UPDATE public.profiles
+    SET billing_type = 'paid'
+   WHERE user_id = p_user_id;
+
+  -- negative usage because the user gained credits
+  INSERT INTO public.transaction_log (transaction_type, user_id, credit_usage)
+  VALUES ('credit_purchase', p_user_id, -p_credits);
+
+  RETURN QUERY SELECT v_balance, true;
+END;
+$$;
+-- grants credits, only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION public.apply_credit_purchase(uuid, numeric, text, timestamptz) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.apply_credit_purchase(uuid, numeric, text, timestamptz) TO service_role;
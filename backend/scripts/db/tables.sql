@@ -0,0 +1,21 @@
+-- Autumn purchases (invoice id + product) already granted, the primary key makes apply_credit_purchase idempotent
+CREATE TABLE IF NOT EXISTS public.applied_purchases (
+  purchase_id text PRIMARY KEY,
+  user_id uuid NOT NULL,
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+-- only the service role (which bypasses RLS) may touch billing tables, a deleted row would re-open a purchase
+ALTER TABLE public.applied_purchases ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.applied_purchases FROM anon, authenticated;
+
+-- when applied_purchases went live. Purchases paid before it were granted by the old flow without a record in
+-- applied_purchases, so apply_credit_purchase treats them as already granted. Set once when this script first
+-- runs (re-running keeps it); move it forward to the moment the last old backend stopped serving if that was later:
+--   UPDATE public.billing_rollout SET purchases_since = '<timestamp>';
+CREATE TABLE IF NOT EXISTS public.billing_rollout (
+  id boolean PRIMARY KEY DEFAULT true CHECK (id),
+  purchases_since timestamptz NOT NULL DEFAULT now()
+);
+INSERT INTO public.billing_rollout DEFAULT VALUES ON CONFLICT DO NOTHING;
+ALTER TABLE public.billing_rollout ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.billing_rollout FROM anon, authenticated;
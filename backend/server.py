@@ -1,31 +1,69 @@
 import logging
-from blacksheep import Application, Request, Request
+import time
+from blacksheep import Application, Content, Request, Request, Response
 from services.storage_service import StorageService
 from services.vertex_service import VertexService
+from services.vertex_rate_limiter import VertexRateLimiter
 from services.job_service import JobService
 from services.supabase_service import SupabaseService
 from services.autumn_service import AutumnService
+from services.billing_service import BillingService
 from services.video_merge_service import VideoMergeService
+from services.redis_service import RedisService
+from services.job_queue_service import JobQueueService
+from services.gemini_cache_service import GeminiCacheService
+from services.segment_cache_service import SegmentCacheService
 from rodi import Container
+from utils import metrics
 
 services = Container()
 
 storage_service = StorageService()
-vertex_service = VertexService()
-job_service = JobService(vertex_service)
+redis_service = RedisService()
+gemini_cache_service = GeminiCacheService(redis_service)
+vertex_service = VertexService(gemini_cache_service, storage_service, VertexRateLimiter(redis_service))
+job_queue_service = JobQueueService(redis_service)
+job_service = JobService(vertex_service, redis_service, job_queue_service)
 supabase_service = SupabaseService()
-autumn_service = AutumnService()
-video_merge_service = VideoMergeService(storage_service)
+autumn_service = AutumnService(redis_service)
+billing_service = BillingService(redis_service, supabase_service, autumn_service)
+segment_cache_service = SegmentCacheService()
+video_merge_service = VideoMergeService(storage_service, segment_cache_service, redis_service)
 
 services.add_instance(storage_service, StorageService)
+services.add_instance(redis_service, RedisService)
+services.add_instance(gemini_cache_service, GeminiCacheService)
 services.add_instance(vertex_service, VertexService)
+services.add_instance(job_queue_service, JobQueueService)
 services.add_instance(job_service, JobService)
 services.add_instance(supabase_service, SupabaseService)
 services.add_instance(autumn_service, AutumnService)
+services.add_instance(billing_service, BillingService)
+services.add_instance(segment_cache_service, SegmentCacheService)
 services.add_instance(video_merge_service, VideoMergeService)
 
 app = Application(services=services)
 
+async def on_start(application: Application):
+    metrics.init_tracing()
+    await redis_service.start()
+    await supabase_service.start()
+    await autumn_service.start()
+    await segment_cache_service.start()
+    await job_service.start()
+
+async def on_stop(application: Application):
+    await job_service.stop()
+    await billing_service.stop()
+    await segment_cache_service.stop()
+    await supabase_service.stop()
+    await autumn_service.stop()
+    await redis_service.stop()
+    await vertex_service.close()
+
+app.on_start += on_start
+app.on_stop += on_stop
+
 # TODO: REMOVE IN PRODUCTION, FOR DEV ONLY
 app.use_cors(
     allow_methods="*",
@@ -33,9 +71,31 @@ app.use_cors(
     allow_headers="*",
 )
 
+async def record_timing(request: Request, handler):
+    """Per-route latency histogram and in-flight gauge, labelled by route pattern rather than raw path"""
+    match = app.router.get_match(request)
+    route = match.pattern.decode() if match else "unmatched"
+    in_flight = metrics.REQUESTS_IN_FLIGHT.labels(request.method, route)
+    in_flight.inc()
+    status = 500
+    start = time.perf_counter()
+    try:
+        with metrics.tracer.start_as_current_span(f"{request.method} {route}"):
+            response = await handler(request)
+        status = response.status
+        return response
+    finally:
+        metrics.REQUEST_LATENCY.labels(request.method, route, str(status)).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+app.middlewares.append(record_timing)
+
 async def attach_user(request: Request):
+    # CORS preflights carry no credentials
+    if request.method == "OPTIONS":
+        return
     try:
-        uid = supabase_service.get_user_id_from_request(request)
+        uid = await supabase_service.get_user_id_from_request(request)
         if uid:
             request.scope["user_id"] = uid
     except Exception:
@@ -44,6 +104,11 @@ async def attach_user(request: Request):
 
 app.middlewares.append(attach_user)
 
+@app.router.get("/metrics")
+def prometheus_metrics():
+    content_type, body = metrics.metrics_response()
+    return Response(200, content=Content(content_type, body))
+
 # random test routes
 @app.router.get("/")
 def hello_world():
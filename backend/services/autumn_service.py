@@ -1,15 +1,111 @@
+import asyncio
+import random
+import time
 import httpx
 from typing import Optional, Dict, Any
+from services.redis_service import RedisService
+from utils import codec
 from utils.env import settings
+from utils.metrics import span
+
+# responses worth retrying, the request never reached Autumn or Autumn asked us to back off
+RETRY_STATUSES = (429, 502, 503, 504)
+# errors where the request was never sent, safe to retry even for POST
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
 
 class AutumnService:
-    def __init__(self):
+    """
+    Autumn billing API client. One pooled HTTP/2 client for the app's lifetime, retries with
+    jittered backoff, and a short-lived per-customer cache of proxied GETs, dropped whenever the
+    customer's billing state changes (webhook, checkout, credit sync).
+    """
+    def __init__(self, redis_service: RedisService):
+        self.redis_service = redis_service
         self.api_key = settings.AUTUMN_SECRET_KEY
         self.base_url = "https://api.useautumn.com/v1"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                http2=True,
+                timeout=httpx.Timeout(settings.AUTUMN_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=settings.AUTUMN_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AUTUMN_MAX_CONNECTIONS,
+                ),
+            )
+
+    async def stop(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send a request on the shared client. GETs are retried on transport errors and 429/5xx,
+        other methods only when the request could not be sent at all.
+        """
+        for attempt in range(settings.AUTUMN_MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                # first path segment only, the rest carries customer ids
+                with span("autumn", f"{method} {path.strip('/').split('/')[0]}"):
+                    response = await self.client.request(method, path, **kwargs)
+                if method != "GET" or response.status_code not in RETRY_STATUSES:
+                    return response
+                retry_after = response.headers.get("retry-after")
+                if attempt == settings.AUTUMN_MAX_RETRIES:
+                    return response
+            except httpx.TransportError as e:
+                if attempt == settings.AUTUMN_MAX_RETRIES or (method != "GET" and not isinstance(e, CONNECT_ERRORS)):
+                    raise
+            # full jitter, so retries from concurrent requests don't arrive together
+            delay = random.uniform(0, settings.AUTUMN_RETRY_BASE_DELAY * 2 ** attempt)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    def _cache_key(self, customer_id: str) -> str:
+        return f"autumn:cache:{customer_id}"
+
+    async def _cache_get(self, customer_id: str, field: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.redis_service.client.hget(self._cache_key(customer_id), field)
+        except Exception as e:
+            print(f"Autumn cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        entry = codec.decode(raw)
+        # the hash expires as a whole, each entry also carries its own age
+        if time.time() - entry["cached_at"] > settings.AUTUMN_CACHE_TTL:
+            return None
+        return entry["result"]
+
+    async def _cache_set(self, customer_id: str, field: str, result: Dict[str, Any]):
+        try:
+            async with self.redis_service.client.pipeline(transaction=True) as pipe:
+                pipe.hset(self._cache_key(customer_id), field, codec.encode({"cached_at": time.time(), "result": result}))
+                pipe.expire(self._cache_key(customer_id), int(settings.AUTUMN_CACHE_TTL) + 1)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Autumn cache write failed: {e}")
+
+    async def invalidate_customer(self, customer_id: str):
+        """Drop cached lookups for a customer whose products or balance changed"""
+        if not customer_id:
+            return
+        try:
+            await self.redis_service.client.delete(self._cache_key(customer_id))
+        except Exception as e:
+            print(f"Autumn cache invalidation failed: {e}")
 
     async def proxy_request(
         self, 
@@ -19,81 +115,69 @@ class AutumnService:
         customer_data: Dict[str, str],
         body: Optional[Dict] = None
     ) -> Dict[str, Any]:
-        """Proxy request to Autumn API (equivalent to autumnHandler)"""
-        async with httpx.AsyncClient() as client:
-            url = f"{self.base_url}/{path}"
-            
-            # Add customer_id to query params for GET, or body for POST/PUT
-            params = {}
-            json_data = body or {}
-            
-            if method == "GET":
-                params["customer_id"] = customer_id
-            else:
-                json_data["customer_id"] = customer_id
-                json_data["customer_data"] = customer_data
-
-            response = await client.request(
-                method=method,
-                url=url,
-                headers=self.headers,
-                params=params if method == "GET" else None,
-                json=json_data if method != "GET" else None
-            )
-            
-            response.raise_for_status()
-            return {
-                "data": response.json(),
-                "status": response.status_code
-            }
-
-    async def get_customer_entitlements(self, customer_id: str) -> Dict[str, Any]:
         """
-        Get customer's entitlements/products from Autumn.
-        Used to verify if a payment actually went through.
+        Proxy request to Autumn API (equivalent to autumnHandler).
+        Successful GETs are cached per customer for AUTUMN_CACHE_TTL seconds, anything else
+        drops the customer's cached lookups.
         """
-        async with httpx.AsyncClient() as client:
-            url = f"{self.base_url}/entitled"
-            params = {"customer_id": customer_id}
-            
-            response = await client.get(
-                url=url,
-                headers=self.headers,
-                params=params
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            return None
+        # Add customer_id to query params for GET, or body for POST/PUT
+        params = {}
+        json_data = body or {}
+        
+        if method == "GET":
+            params["customer_id"] = customer_id
+            if customer_id and settings.AUTUMN_CACHE_TTL > 0:
+                cached = await self._cache_get(customer_id, path)
+                if cached is not None:
+                    return cached
+        else:
+            json_data["customer_id"] = customer_id
+            json_data["customer_data"] = customer_data
+
+        response = await self._request(
+            method,
+            path,
+            params=params if method == "GET" else None,
+            json=json_data if method != "GET" else None
+        )
+        
+        response.raise_for_status()
+        result = {
+            "data": response.json(),
+            "status": response.status_code
+        }
+        if method == "GET":
+            if customer_id and settings.AUTUMN_CACHE_TTL > 0:
+                await self._cache_set(customer_id, path, result)
+        else:
+            await self.invalidate_customer(customer_id)
+        return result
 
-    async def check_product_purchased(self, customer_id: str, product_id: str) -> bool:
+    async def get_paid_purchases(self, customer_id: str) -> Optional[list[tuple[str, str, float]]]:
         """
-        Check if customer has purchased a specific product.
-        Returns True if the product was purchased, False otherwise.
+        (purchase id, product id, invoice time as unix seconds) of every paid purchase on the customer's Autumn
+        record, None if Autumn couldn't be asked. The purchase id is Autumn's invoice id plus the product, the same
+        however the purchase is reported (webhook of any event type or the checkout redirect). Never cached.
         """
         try:
-            async with httpx.AsyncClient() as client:
-                # Check customer's products/subscriptions
-                url = f"{self.base_url}/customers/{customer_id}"
-                
-                response = await client.get(
-                    url=url,
-                    headers=self.headers
-                )
-                
-                if response.status_code != 200:
-                    print(f"Failed to get customer: {response.status_code}")
-                    return False
-                
-                data = response.json()
-                products = data.get("products", [])
-                
-                # Check if the product_id is in customer's products
-                for product in products:
-                    if product.get("id") == product_id:
-                        return True
-                
-                return False
-        except Exception as e:
-            print(f"Error checking product purchase: {e}")
-            return False
\ No newline at end of file
+            response = await self._request("GET", f"/customers/{customer_id}", params={"expand": "invoices"})
+        except httpx.HTTPError as e:
+            print(f"Error fetching purchases: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"Failed to get customer: {response.status_code}")
+            return None
+
+        purchases = []
+        for invoice in response.json().get("invoices") or []:
+            invoice_id = invoice.get("stripe_id") or invoice.get("id")
+            if not invoice_id or invoice.get("status") != "paid":
+                continue
+            if not invoice.get("created_at"):
+                # can't tell whether the old flow already granted it
+                print(f"Skipping invoice {invoice_id} without created_at")
+                continue
+            for product_id in invoice.get("product_ids") or []:
+                # Autumn timestamps are milliseconds
+                purchases.append((f"{invoice_id}:{product_id}", product_id, invoice["created_at"] / 1000))
+        return purchases
@@ -0,0 +1,101 @@
+import asyncio
+import random
+from typing import Optional, Tuple
+from services.autumn_service import AutumnService
+from services.redis_service import RedisService
+from services.supabase_service import SupabaseService
+from utils.env import settings
+
+# Map product IDs to credit amounts
+PRODUCT_CREDITS = {
+    "starter-pack": 500,
+    "pro-pack": 2000,
+}
+
+class BillingService:
+    """
+    Grants purchased credits exactly once per paid purchase.
+    Nothing is granted from what the client or a webhook claims: the webhook and the /sync-credits
+    redirect both read the customer's paid purchases from Autumn and apply each of them through the
+    apply_credit_purchase RPC, keyed by Autumn's purchase id and backed by a unique constraint.
+    A purchase reported twice (redirect and webhook, or several event types for one payment)
+    is therefore applied once, and a checkout that was never paid has nothing to apply.
+    Purchases paid before the rollout (billing_rollout in scripts/db/tables.sql) are never applied.
+    """
+    def __init__(self, redis_service: RedisService, supabase_service: SupabaseService, autumn_service: AutumnService):
+        self.redis_service = redis_service
+        self.supabase_service = supabase_service
+        self.autumn_service = autumn_service
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def redis_client(self):
+        return self.redis_service.client
+
+    def _event_key(self, event_id: str) -> str:
+        return f"billing:event:{event_id}"
+
+    async def claim_event(self, event_id: str) -> bool:
+        """False if this webhook event was already accepted, one SET NX before any other work"""
+        return bool(await self.redis_client.set(self._event_key(event_id), 1, nx=True, ex=settings.BILLING_EVENT_TTL))
+
+    async def grant_purchases(self, customer_id: str, product_id: str) -> Tuple[Optional[float], int, Optional[str]]:
+        """
+        Apply every paid purchase of `product_id` that hasn't been applied yet.
+        Returns (balance, credits added, None); errors are "no_paid_purchase" (Autumn has no paid purchase of
+        the product), "autumn_unavailable" or "apply_failed", and leave the unapplied purchases for a later call.
+        """
+        purchases = await self.autumn_service.get_paid_purchases(customer_id)
+        if purchases is None:
+            return (None, 0, "autumn_unavailable")
+        purchases = [(purchase_id, paid_at) for purchase_id, purchased, paid_at in purchases if purchased == product_id]
+        if not purchases:
+            return (None, 0, "no_paid_purchase")
+
+        balance, credits_added = None, 0
+        for purchase_id, paid_at in purchases:
+            result = await self.supabase_service.apply_credit_purchase(
+                customer_id, PRODUCT_CREDITS[product_id], purchase_id, paid_at
+            )
+            if result is None:
+                return (None, credits_added, "apply_failed")
+            balance, applied = result
+            if applied:
+                credits_added += PRODUCT_CREDITS[product_id]
+                print(f"Applied purchase {purchase_id} for user {customer_id}: +{PRODUCT_CREDITS[product_id]} credits, balance {balance}")
+
+        if credits_added:
+            # the pricing page should see the new product right away
+            await self.autumn_service.invalidate_customer(customer_id)
+        return (balance, credits_added, None)
+
+    def grant_purchase_later(self, event_id: str, customer_id: str, product_id: str):
+        """Grant in the background so the webhook can be acknowledged right away"""
+        task = asyncio.create_task(self._grant_with_retries(event_id, customer_id, product_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _grant_with_retries(self, event_id: str, customer_id: str, product_id: str):
+        # no_paid_purchase is retried too, the webhook can arrive before Autumn lists the purchase
+        for attempt in range(settings.BILLING_GRANT_ATTEMPTS):
+            try:
+                _, _, error = await self.grant_purchases(customer_id, product_id)
+            except Exception as e:
+                error = str(e)
+            if error is None:
+                return
+            await asyncio.sleep(random.uniform(0, 2 ** attempt))
+
+        # let a redelivery of this event try again, the redirect can still grant the purchase too
+        print(f"Webhook event {event_id}: giving up on granting {product_id} to user {customer_id}: {error}")
+        try:
+            await self.redis_client.delete(self._event_key(event_id))
+        except Exception as e:
+            print(f"Failed to release webhook event {event_id}: {e}")
+
+    async def stop(self):
+        """Give in-flight grants a moment to finish before the clients they use are closed"""
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=10)
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable
+from services.redis_service import RedisService
+from utils.env import settings
+from utils.ttl_cache import TTLCache
+
+class GeminiCacheService:
+    """
+    Content-addressed cache for Gemini results (image clean-ups, annotation analysis).
+    Keyed by SHA-256 of the input bytes plus the prompt and model name, so regenerating the same
+    storyboard frame with a different video prompt reuses the earlier Gemini work.
+    A local LRU sits in front of Redis; both share GEMINI_CACHE_TTL.
+    """
+    def __init__(self, redis_service: RedisService):
+        self.redis_service = redis_service
+        self.local = TTLCache(
+            max_items=settings.GEMINI_CACHE_LOCAL_MAX_ITEMS,
+            ttl=settings.GEMINI_CACHE_TTL,
+            max_bytes=settings.GEMINI_CACHE_LOCAL_MAX_BYTES,
+        )
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, model: str, prompt: str, data: bytes) -> str:
+        content_hash = hashlib.sha256(data).hexdigest()
+        prompt_hash = hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+        return f"gemini-cache:{content_hash}:{prompt_hash}"
+
+    async def get_or_compute(
+        self, model: str, prompt: str, data: bytes, compute: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        """Return the cached result for (model, prompt, data), calling `compute` on a miss"""
+        if not settings.GEMINI_CACHE_ENABLED:
+            return await compute()
+
+        # hashing a multi-MB image takes milliseconds, hashlib releases the GIL for it
+        key = await asyncio.to_thread(self._key, model, prompt, data)
+        value = self.local.get(key)
+        if value is not None:
+            self.hits_local += 1
+            return value
+
+        try:
+            value = await self.redis_service.client.get(key)
+        except Exception as e:
+            # cache trouble must never fail the request
+            print(f"Gemini cache read failed: {e}")
+            self.errors += 1
+            value = None
+        if value is not None:
+            self.hits_redis += 1
+            self.local.set(key, value)
+            return value
+
+        self.misses += 1
+        value = await compute()
+        self.local.set(key, value)
+        if len(value) <= settings.GEMINI_CACHE_MAX_ITEM_BYTES:
+            try:
+                await self.redis_service.client.set(key, value, ex=settings.GEMINI_CACHE_TTL)
+            except Exception as e:
+                print(f"Gemini cache write failed: {e}")
+                self.errors += 1
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits_local + self.hits_redis + self.misses
+        return {
+            "hits_local": self.hits_local,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": (self.hits_local + self.hits_redis) / lookups if lookups else 0.0,
+            "local_items": len(self.local),
+            "local_bytes": self.local.size_bytes,
+        }
@@ -0,0 +1,69 @@
+import redis.asyncio as redis
+from services.redis_service import RedisService
+from utils.env import settings
+
+STREAM_KEY = "jobs:queue"
+GROUP_NAME = "video-workers"
+
+class JobQueueService:
+    """
+    Durable video job queue on a Redis Stream with a consumer group.
+    An entry stays in the group's pending list until a worker acknowledges it. Entries a worker
+    has not touched for JOB_QUEUE_VISIBILITY_TIMEOUT seconds (crash, deploy, OOM) are reclaimed
+    by another worker, so a job is never lost once it is queued.
+    """
+    def __init__(self, redis_service: RedisService):
+        self.redis_service = redis_service
+        self._autoclaim_cursor = "0-0"
+
+    @property
+    def redis_client(self):
+        return self.redis_service.client
+
+    async def ensure_group(self):
+        try:
+            await self.redis_client.xgroup_create(STREAM_KEY, GROUP_NAME, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue(self, pipe, job_id: str):
+        """Queue job_id on the caller's pipeline, so it is written atomically with the job record"""
+        pipe.xadd(STREAM_KEY, {"job_id": job_id}, maxlen=settings.JOB_QUEUE_MAXLEN, approximate=True)
+
+    async def claim(self, consumer: str, count: int) -> list[tuple[str, str]]:
+        """
+        Return up to `count` (entry_id, job_id) pairs for this consumer.
+        Entries whose visibility timeout expired are taken over first, then new entries are read.
+        """
+        self._autoclaim_cursor, entries, *_ = await self.redis_client.xautoclaim(
+            STREAM_KEY,
+            GROUP_NAME,
+            consumer,
+            min_idle_time=int(settings.JOB_QUEUE_VISIBILITY_TIMEOUT * 1000),
+            start_id=self._autoclaim_cursor,
+            count=count,
+        )
+        if not entries:
+            response = await self.redis_client.xreadgroup(
+                GROUP_NAME,
+                consumer,
+                {STREAM_KEY: ">"},
+                count=count,
+                block=settings.JOB_QUEUE_BLOCK_MS,
+            )
+            entries = response[0][1] if response else []
+        # entries trimmed from the stream come back without fields
+        return [(entry_id.decode(), fields[b"job_id"].decode()) for entry_id, fields in entries if fields]
+
+    async def touch(self, consumer: str, entry_id: str):
+        """Reset the entry's idle time so it is not reclaimed while this worker is still on it"""
+        await self.redis_client.xclaim(
+            STREAM_KEY, GROUP_NAME, consumer, min_idle_time=0, message_ids=[entry_id], justid=True
+        )
+
+    async def ack(self, entry_id: str):
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.xack(STREAM_KEY, GROUP_NAME, entry_id)
+            pipe.xdel(STREAM_KEY, entry_id)
+            await pipe.execute()
@@ -1,159 +1,648 @@
 from datetime import datetime
-from typing import Optional
-from models.job import JobStatus, VideoJobRequest, VideoJob
+from typing import AsyncIterator, Optional
+from models.job import JobStatus, VideoJobClaim, VideoJobRequest, VideoJob
 from services.vertex_service import VertexService
+from services.redis_service import RedisService
+from services.job_queue_service import JobQueueService
+from services.vertex_rate_limiter import PRIORITY_FREE, PRIORITY_PAID, request_priority
 from utils.prompt_builder import create_video_prompt
 from utils.env import settings
+from utils import codec
+from utils import metrics
+from utils.pipeline import Pipeline, RedisCheckpoint, Stage
 import uuid
-import redis
-import pickle
-import lzma
 import asyncio
+import hashlib
+import os
+import socket
+import time
 import traceback
 
+JOB_TTL_SECONDS = 300
+# sorted set of job ids with a submitted Veo operation, scored by next poll time (unix seconds)
+OPERATIONS_KEY = "jobs:operations"
+# every state change is published on jobs:{job_id}:events, one pattern subscription per process fans them out
+EVENTS_PATTERN = "jobs:*:events"
+TERMINAL_STATES = ("done", "error")
+# lifetime of a claimed job that create_video_job has not queued yet (request still charging credits)
+CLAIM_TTL_SECONDS = 30
+
 class JobService:
-    def __init__(self, vertex_service: VertexService):
+    def __init__(self, vertex_service: VertexService, redis_service: RedisService, job_queue_service: JobQueueService):
         self.vertex_service = vertex_service
-        self.redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=False)
+        self.redis_service = redis_service
+        self.job_queue_service = job_queue_service
+        self._poller_task: Optional[asyncio.Task] = None
+        self._events_task: Optional[asyncio.Task] = None
+        self._worker_task: Optional[asyncio.Task] = None
+        # job_id -> queues of local watchers (SSE / WebSocket streams)
+        self._watchers: dict[str, set[asyncio.Queue]] = {}
+        # shared by the pipelines of every job this process runs
+        self._gemini_stage_limit = asyncio.Semaphore(settings.JOB_GEMINI_STAGE_CONCURRENCY) if settings.JOB_GEMINI_STAGE_CONCURRENCY else None
+        self._veo_stage_limit = asyncio.Semaphore(settings.JOB_VEO_STAGE_CONCURRENCY) if settings.JOB_VEO_STAGE_CONCURRENCY else None
+
+    async def start(self):
+        """Start the job event listener, plus a worker when JOB_WORKER_IN_PROCESS is set (called on app startup)"""
+        if self._events_task is None:
+            self._events_task = asyncio.create_task(self._listen_job_events())
+        if settings.JOB_WORKER_IN_PROCESS:
+            await self.start_worker(f"web-{socket.gethostname()}-{os.getpid()}")
+
+    async def start_worker(self, consumer: str):
+        """Consume queued jobs and poll their Veo operations (see worker.py)"""
+        await self.job_queue_service.ensure_group()
+        if self._worker_task is None:
+            self._worker_task = asyncio.create_task(self._consume_jobs(consumer))
+        if self._poller_task is None:
+            self._poller_task = asyncio.create_task(self._poll_operations())
+
+    async def stop(self):
+        # unacknowledged jobs of a stopped worker are picked up again after the visibility timeout
+        for task in (self._worker_task, self._poller_task, self._events_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._worker_task = None
+        self._poller_task = None
+        self._events_task = None
+
+    @property
+    def redis_client(self):
+        # pool is created on app startup, so resolve the client lazily
+        return self.redis_service.client
 
     def _serialize(self, data: dict) -> bytes:
-        """Serialize + compress any data to bytes for Redis storage"""
-        return lzma.compress(pickle.dumps(data))
+        """Encode data to bytes for Redis storage (see utils/codec.py)"""
+        return codec.encode(data)
     
     def _deserialize(self, data: bytes) -> Optional[dict]:
-        """Deserialize + decompress bytes from Redis storage"""
-        if not data:
+        """Decode bytes from Redis storage (see utils/codec.py)"""
+        return codec.decode(data)
+
+    def _job_key(self, job_id: str) -> str:
+        # one hash per job; separate "jobs:" prefix so it never collides with the old per-state string keys
+        return f"jobs:{job_id}"
+
+    def _events_channel(self, job_id: str) -> str:
+        return f"jobs:{job_id}:events"
+
+    def _input_key(self, job_id: str) -> str:
+        # request payload (images + prompts) waiting for a worker
+        return f"jobs:{job_id}:input"
+
+    def _fingerprint_key(self, fingerprint: str) -> str:
+        # job_id of the in-flight job for a fingerprint, dropped once it is done
+        return f"jobs:fingerprint:{fingerprint}"
+
+    def _result_key(self, fingerprint: str) -> str:
+        # video_url + metadata of the last finished job for a fingerprint
+        return f"jobs:result:{fingerprint}"
+
+    def _fingerprint(self, request: VideoJobRequest, user_id: str) -> str:
+        """
+        Hash of everything that determines the generated video. Scoped to the user, so neither
+        results nor charges are shared across accounts.
+        """
+        digest = hashlib.sha256()
+        for part in (
+            user_id.encode(),
+            hashlib.sha256(request.starting_image).digest(),
+            hashlib.sha256(request.ending_image).digest() if request.ending_image else b"",
+            request.custom_prompt.encode(),
+            request.global_context.encode(),
+            str(request.duration_seconds).encode(),
+        ):
+            # length-prefixed so neighbouring fields can't run into each other
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _queue_job_state(self, pipe, job_id: str, state: str, next_poll_at: Optional[float] = None, **fields):
+        """
+        Add the commands that move a job to `state` and refresh its TTL to `pipe`.
+        `next_poll_at` registers the job's operation with the poller, terminal states unregister it.
+        """
+        mapping = {"state": state}
+        mapping.update({k: v for k, v in fields.items() if v is not None})
+        key = self._job_key(job_id)
+        pipe.hset(key, mapping=mapping)
+        # unfinished jobs are kept around for as long as their input, so neither a backlog nor stages waiting on
+        # Vertex quota (up to JOB_STAGE_TIMEOUT per attempt) drop a paid job; finished ones only need to be read once
+        pipe.expire(key, JOB_TTL_SECONDS if state in TERMINAL_STATES else settings.JOB_QUEUE_TTL)
+        if next_poll_at is not None:
+            pipe.zadd(OPERATIONS_KEY, {job_id: next_poll_at})
+        elif state in TERMINAL_STATES:
+            pipe.zrem(OPERATIONS_KEY, job_id)
+        pipe.publish(self._events_channel(job_id), state)
+
+    async def _set_job_state(self, job_id: str, state: str, next_poll_at: Optional[float] = None, **fields):
+        """Move a job to `state` in a single MULTI/EXEC round trip"""
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            self._queue_job_state(pipe, job_id, state, next_poll_at, **fields)
+            await pipe.execute()
+
+    async def _get_job(self, job_id: str) -> Optional[VideoJob]:
+        """Read the whole job record in one round trip, None if it does not exist"""
+        return self._decode_job(await self.redis_client.hgetall(self._job_key(job_id)))
+
+    def _decode_job(self, raw: dict) -> Optional[VideoJob]:
+        if not raw:
             return None
-        return pickle.loads(lzma.decompress(data))
+        job: VideoJob = {k.decode(): v for k, v in raw.items()}
+        for field in ("state", "job_start_time", "job_end_time", "operation_name", "video_url", "error", "poll_delay", "attempts", "fingerprint"):
+            if field in job:
+                job[field] = job[field].decode()
+        if "metadata" in job:
+            job["metadata"] = self._deserialize(job["metadata"])
+        return job
+
+    async def claim_video_job(self, request: VideoJobRequest, user_id: str) -> VideoJobClaim:
+        """
+        Reserve a job id for `request`. An identical job still in flight on any replica is attached to
+        (SET NX on its fingerprint), a recently finished one is answered from the result index with a job
+        that is already done. Coalesced claims need neither a charge nor create_video_job; any other claim
+        must be followed by create_video_job or release_video_job.
+
+        The pending job record is written before the fingerprint points at it, so a coalesced job id can
+        always be looked up, even while the first request is still being charged.
+        """
+        if not settings.JOB_COALESCE:
+            return VideoJobClaim(job_id=str(uuid.uuid4()))
+
+        # hashlib drops the GIL on large inputs, keep multi-MB images off the event loop
+        fingerprint = await asyncio.to_thread(self._fingerprint, request, user_id)
+        fingerprint_key = self._fingerprint_key(fingerprint)
+        for _ in range(2):
+            result = await self.redis_client.get(self._result_key(fingerprint))
+            if result is not None:
+                job_id = await self._create_done_job(self._deserialize(result))
+                return VideoJobClaim(job_id, fingerprint, coalesced=True)
+
+            job_id = str(uuid.uuid4())
+            job_key = self._job_key(job_id)
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                # short-lived until create_video_job queues it, so a crashed request leaves nothing behind
+                pipe.hset(job_key, mapping={
+                    "state": "pending", "job_start_time": datetime.now().isoformat(), "fingerprint": fingerprint,
+                })
+                pipe.expire(job_key, CLAIM_TTL_SECONDS)
+                pipe.set(fingerprint_key, job_id, nx=True, ex=CLAIM_TTL_SECONDS)
+                _, _, claimed = await pipe.execute()
+            if claimed:
+                return VideoJobClaim(job_id, fingerprint)
+            await self.redis_client.delete(job_key)
 
-    async def create_video_job(self, request: VideoJobRequest) -> str:
-        """Create a video job and return job_id immediately, processing happens in background"""
+            existing = await self.redis_client.get(fingerprint_key)
+            if existing is None:
+                continue # finished in the meantime, check the result index again
+            existing = existing.decode()
+            job = await self._get_job(existing)
+            if job is not None and job["state"] != "error":
+                return VideoJobClaim(existing, fingerprint, coalesced=True)
+            # the job failed, or expired without finishing: start over
+            await self.redis_client.delete(fingerprint_key)
+
+        # lost the claim twice in a row, don't make the user wait for it
+        return VideoJobClaim(job_id=str(uuid.uuid4()))
+
+    async def release_video_job(self, claim: VideoJobClaim, error: str):
+        """
+        Give up a claim that won't be turned into a job (e.g. the charge failed). Its record is marked as
+        errored, so submissions that were coalesced onto it in the meantime see the failure.
+        """
+        if not claim.fingerprint or claim.coalesced:
+            return
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            self._queue_job_state(pipe, claim.job_id, "error", error=error)
+            pipe.delete(self._fingerprint_key(claim.fingerprint))
+            await pipe.execute()
+
+    async def _create_done_job(self, result: dict) -> str:
+        """A new job that is already done, pointing at the video of an identical earlier job"""
         job_id = str(uuid.uuid4())
-        
-        pending_job = {
-            "status": "pending",
-            "job_start_time": datetime.now().isoformat()
+        now = datetime.now().isoformat()
+        await self._set_job_state(
+            job_id,
+            "done",
+            job_start_time=now,
+            job_end_time=now,
+            video_url=result["video_url"],
+            metadata=self._serialize(result["metadata"]) if result.get("metadata") else None,
+        )
+        return job_id
+
+    async def create_video_job(self, claim: VideoJobClaim, request: VideoJobRequest) -> str:
+        """
+        Create the video job for a fresh claim and return its job_id immediately. The job record, its input
+        and the queue entry are written in one transaction, a worker picks it up from the queue.
+        """
+        job_id = claim.job_id
+
+        job_input = {
+            "starting_image": request.starting_image,
+            "global_context": request.global_context,
+            "custom_prompt": request.custom_prompt,
+            "duration_seconds": request.duration_seconds,
+            "paid": int(request.paid),
         }
-        # Store pending job BEFORE starting background task to avoid 404 race condition
-        self.redis_client.setex(f"job:{job_id}:pending", 300, self._serialize(pending_job))
-        
-        # start background task
-        asyncio.create_task(self._process_video_job(job_id, request))
-        
+        if request.ending_image:
+            job_input["ending_image"] = request.ending_image
+
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._input_key(job_id), mapping=job_input)
+            pipe.expire(self._input_key(job_id), settings.JOB_QUEUE_TTL)
+            # Store pending job BEFORE a worker can see it to avoid 404 race condition
+            self._queue_job_state(
+                pipe, job_id, "pending", job_start_time=datetime.now().isoformat(), fingerprint=claim.fingerprint
+            )
+            if claim.fingerprint:
+                # identical submissions attach to this job for as long as it may wait in the queue
+                pipe.expire(self._fingerprint_key(claim.fingerprint), settings.JOB_QUEUE_TTL)
+            self.job_queue_service.enqueue(pipe, job_id)
+            await pipe.execute()
+
         return job_id
-    
-    async def _process_video_job(self, job_id: str, request: VideoJobRequest):
-        """Background task that processes the video generation"""
+
+    async def _load_job_input(self, job_id: str) -> Optional[VideoJobRequest]:
+        raw = await self.redis_client.hgetall(self._input_key(job_id))
+        if not raw:
+            return None
+        return VideoJobRequest(
+            starting_image=raw[b"starting_image"],
+            ending_image=raw.get(b"ending_image"),
+            global_context=raw[b"global_context"].decode(),
+            custom_prompt=raw[b"custom_prompt"].decode(),
+            duration_seconds=int(raw[b"duration_seconds"]),
+            paid=raw.get(b"paid") == b"1",
+        )
+
+    async def _consume_jobs(self, consumer: str):
+        """Worker loop: claim queued jobs and process up to JOB_WORKER_CONCURRENCY of them at once"""
+        running: set[asyncio.Task] = set()
         try:
-            # for parallel tasks
-            tasks = [
-                self.vertex_service.analyze_image_content(
-                    prompt="Describe any animation annotations you see. Use this description to inform a video director. Be descriptive about location and purpose of the annotations.",
-                    image_data=request.starting_image
-                ),
-                self.vertex_service.generate_image_content(
-                    prompt="Remove all text, captions, subtitles, annotations from this image. Generate a clean version of the image with no text. Keep everything else the exact same.",
-                    image=request.starting_image
-                )
-            ]
-            
-            if request.ending_image:
-                tasks.append(
-                    self.vertex_service.generate_image_content(
-                        prompt="Remove all text, captions, subtitles, annotations from this image. Generate a clean version of the image with no text. Keep the art/image style the exact same.",
-                        image=request.ending_image
-                    )
-                )
-            
-            results = await asyncio.gather(*tasks)
-            annotation_description = results[0]
-            starting_frame = results[1]
-            ending_frame = results[2] if len(results) > 2 else None
+            while True:
+                try:
+                    free = settings.JOB_WORKER_CONCURRENCY - len(running)
+                    if free <= 0:
+                        await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                        continue
+                    for entry_id, job_id in await self.job_queue_service.claim(consumer, free):
+                        task = asyncio.create_task(self._run_queued_job(consumer, entry_id, job_id))
+                        running.add(task)
+                        task.add_done_callback(running.discard)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error in job worker {consumer}: {e}")
+                    traceback.print_exc()
+                    await asyncio.sleep(1)
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _keep_claimed(self, consumer: str, entry_id: str):
+        while True:
+            await asyncio.sleep(settings.JOB_QUEUE_VISIBILITY_TIMEOUT / 3)
+            await self.job_queue_service.touch(consumer, entry_id)
+
+    async def _run_queued_job(self, consumer: str, entry_id: str, job_id: str):
+        """
+        Process one queue entry. The entry is acknowledged once the Veo operation is submitted or the
+        job failed for good; otherwise it stays pending and is retried after the visibility timeout.
+        """
+        heartbeat = asyncio.create_task(self._keep_claimed(consumer, entry_id))
+        job = None
+        # set once the job ended here; submitted jobs are observed by the poller when Veo finishes
+        final_status = None
+        try:
+            job = await self._get_job(job_id)
+            if job is None or job["state"] not in ("pending", "analyzing"):
+                # expired, or an earlier delivery already got past submission
+                await self.job_queue_service.ack(entry_id)
+                return
+
+            request = await self._load_job_input(job_id)
+            if request is None:
+                await self._set_job_state(job_id, "error", error="Job input expired before it was processed")
+                final_status = "error"
+                await self.job_queue_service.ack(entry_id)
+                return
+
+            attempts = await self.redis_client.hincrby(self._job_key(job_id), "attempts", 1)
+            final_attempt = attempts >= settings.JOB_MAX_ATTEMPTS
+            processed = await self._process_video_job(
+                job_id, request, final_attempt=final_attempt,
+                job_start_time=job["job_start_time"], fingerprint=job.get("fingerprint"),
+            )
+            if not processed and final_attempt:
+                final_status = "error"
+            if processed or final_attempt:
+                await self.redis_client.delete(self._input_key(job_id))
+                await self._checkpoint(job_id).clear()
+                await self.job_queue_service.ack(entry_id)
+        finally:
+            heartbeat.cancel()
+            if final_status:
+                self._observe_job_duration(job, final_status)
+
+    def _observe_job_duration(self, job: VideoJob, status: str):
+        job_duration = datetime.now() - datetime.fromisoformat(job["job_start_time"])
+        metrics.JOB_DURATION.labels(status).observe(job_duration.total_seconds())
+
+    def _checkpoint(self, job_id: str) -> RedisCheckpoint:
+        # checkpointed stage results in jobs:{id}:stages, a retried job resumes after its last completed stage
+        return RedisCheckpoint(self.redis_client, f"jobs:{job_id}:stages", settings.JOB_QUEUE_TTL)
 
+    def _video_pipeline(self, job_id: str, request: VideoJobRequest) -> Pipeline:
+        """The stages from a submitted job to a running Veo operation"""
+        async def analyze_annotations():
+            return await self.vertex_service.analyze_image_content(
+                prompt="Describe any animation annotations you see. Use this description to inform a video director. Be descriptive about location and purpose of the annotations.",
+                image_data=request.starting_image
+            )
+
+        async def clean_start_frame():
+            return await self.vertex_service.generate_image_content(
+                prompt="Remove all text, captions, subtitles, annotations from this image. Generate a clean version of the image with no text. Keep everything else the exact same.",
+                image=request.starting_image
+            )
+
+        async def clean_end_frame():
+            return await self.vertex_service.generate_image_content(
+                prompt="Remove all text, captions, subtitles, annotations from this image. Generate a clean version of the image with no text. Keep the art/image style the exact same.",
+                image=request.ending_image
+            )
+
+        async def build_prompt(analyze_annotations: str):
+            return create_video_prompt(request.custom_prompt, request.global_context, analyze_annotations)
+
+        async def submit_video(build_prompt: str, clean_start_frame: bytes, clean_end_frame: Optional[bytes] = None):
             operation = await self.vertex_service.generate_video_content(
-                create_video_prompt(request.custom_prompt, request.global_context, annotation_description),
-                starting_frame,
-                ending_frame,
+                build_prompt,
+                clean_start_frame,
+                clean_end_frame,
                 request.duration_seconds
             )
-            
-            # Store only the operation name (string) instead of full operation object to save space
-            job = {
-                "job_id": job_id,
-                "operation_name": operation.name,
-                "job_start_time": datetime.now().isoformat(),
-                "metadata": {
-                    "annotation_description": annotation_description
-                }
-            }
-            
-            self.redis_client.delete(f"job:{job_id}:pending")
-            self.redis_client.setex(f"job:{job_id}", 300, self._serialize(job))
+            return operation.name
+
+        gemini = dict(
+            retries=settings.JOB_STAGE_RETRIES,
+            retry_delay=settings.JOB_STAGE_RETRY_DELAY,
+            timeout=settings.JOB_STAGE_TIMEOUT,
+            semaphore=self._gemini_stage_limit,
+        )
+        stages = [
+            Stage("analyze_annotations", analyze_annotations, **gemini),
+            Stage("clean_start_frame", clean_start_frame, **gemini),
+            Stage("build_prompt", build_prompt, depends_on=("analyze_annotations",)),
+        ]
+        submit_depends_on = ("build_prompt", "clean_start_frame")
+        if request.ending_image:
+            stages.append(Stage("clean_end_frame", clean_end_frame, **gemini))
+            submit_depends_on += ("clean_end_frame",)
+        # never retried here: a submit that timed out may still have started an operation
+        stages.append(Stage(
+            "submit_video",
+            submit_video,
+            depends_on=submit_depends_on,
+            semaphore=self._veo_stage_limit,
+            checkpoint=False,
+        ))
+
+        return Pipeline(
+            "video_job",
+            stages,
+            checkpoint=self._checkpoint(job_id),
+        )
+
+    async def _process_video_job(
+        self,
+        job_id: str,
+        request: VideoJobRequest,
+        final_attempt: bool = True,
+        job_start_time: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ) -> bool:
+        """
+        Processes the video generation up to submitting the Veo operation (see _video_pipeline). Returns False on
+        failure; the job is only marked as errored on the final attempt, otherwise it goes back to pending for a
+        retry that skips the stages which already completed.
+        """
+        # this job runs in its own task, the priority covers all of its Vertex calls
+        request_priority.set(PRIORITY_PAID if request.paid else PRIORITY_FREE)
+        pipeline = self._video_pipeline(job_id, request)
+        # written with every state change, so a record that expired meanwhile comes back whole, never partial
+        record = {"job_start_time": job_start_time or datetime.now().isoformat(), "fingerprint": fingerprint}
+        try:
+            await self._set_job_state(job_id, "analyzing", **record)
+            results = await pipeline.run()
+
+            # Store only the operation name (string) instead of full operation object to save space,
+            # the background poller picks it up from here
+            await self._set_job_state(
+                job_id,
+                "generating",
+                next_poll_at=time.time() + settings.JOB_POLL_INITIAL_DELAY,
+                operation_name=results["submit_video"],
+                poll_delay=settings.JOB_POLL_INITIAL_DELAY,
+                **record,
+                metadata=self._serialize({
+                    "annotation_description": results["analyze_annotations"],
+                    # seconds per stage of this attempt, stages restored from a checkpoint are missing
+                    "stage_durations": {stage: round(duration, 3) for stage, duration in pipeline.durations.items()},
+                    "stage_waits": {stage: round(wait, 3) for stage, wait in pipeline.waits.items()},
+                }),
+            )
+            return True
             
         except Exception as e:
             # debug stuff
             print(f"Error processing video job {job_id}: {e}")
             traceback.print_exc()
-            error_job = {
-                "status": "error",
-                "error": str(e),
-                "job_start_time": datetime.now().isoformat()
-            }
-            self.redis_client.delete(f"job:{job_id}:pending")
-            self.redis_client.setex(f"job:{job_id}:error", 300, self._serialize(error_job))
+            if final_attempt:
+                await self._set_job_state(job_id, "error", error=str(e), **record)
+            else:
+                await self._set_job_state(job_id, "pending", **record)
+            return False
+
+    async def _poll_operations(self):
+        """
+        Background loop that polls Vertex for every in-flight operation and writes the result
+        into the job record, so status reads never go upstream. Upstream calls scale with the
+        number of jobs, not the number of clients polling them.
+        """
+        while True:
+            try:
+                due = await self.redis_client.zrangebyscore(
+                    OPERATIONS_KEY, "-inf", time.time(), start=0, num=settings.JOB_POLLER_BATCH_SIZE
+                )
+                await asyncio.gather(*(self._poll_operation(job_id.decode()) for job_id in due))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in operation poller: {e}")
+                traceback.print_exc()
+            await asyncio.sleep(settings.JOB_POLLER_INTERVAL)
+
+    async def _poll_operation(self, job_id: str):
+        # short lock so only one replica polls a given operation at a time
+        lock_key = f"jobs:{job_id}:poll-lock"
+        if not await self.redis_client.set(lock_key, b"1", nx=True, ex=60):
+            return
+        try:
+            job = await self._get_job(job_id)
+            if job is None or job["state"] != "generating":
+                # expired or already finished
+                await self.redis_client.zrem(OPERATIONS_KEY, job_id)
+                return
+
+            delay = min(float(job.get("poll_delay") or settings.JOB_POLL_INITIAL_DELAY) * 2, settings.JOB_POLL_MAX_DELAY)
+            try:
+                result = await self.vertex_service.get_video_status_by_name(job["operation_name"])
+            except Exception as e:
+                # transient upstream failure, try again later
+                print(f"Error polling operation for job {job_id}: {e}")
+                result = None
+
+            if result and result.status in TERMINAL_STATES:
+                self._observe_job_duration(job, result.status)
+
+            fingerprint = job.get("fingerprint")
+            if result and result.status == "done":
+                video_url = result.video_url.replace("gs://", "https://storage.googleapis.com/")
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    self._queue_job_state(pipe, job_id, "done", video_url=video_url, job_end_time=datetime.now().isoformat())
+                    if fingerprint:
+                        # later identical submissions get this video instead of a new Veo operation
+                        pipe.set(
+                            self._result_key(fingerprint),
+                            self._serialize({"video_url": video_url, "metadata": job.get("metadata")}),
+                            ex=settings.JOB_RESULT_INDEX_TTL,
+                        )
+                        pipe.delete(self._fingerprint_key(fingerprint))
+                    await pipe.execute()
+            elif result and result.status == "error":
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    self._queue_job_state(pipe, job_id, "error", error=result.error)
+                    if fingerprint:
+                        pipe.delete(self._fingerprint_key(fingerprint))
+                    await pipe.execute()
+            else:
+                # back off, the TTL is intentionally not refreshed while waiting
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    pipe.hset(self._job_key(job_id), "poll_delay", delay)
+                    pipe.zadd(OPERATIONS_KEY, {job_id: time.time() + delay})
+                    await pipe.execute()
+        finally:
+            await self.redis_client.delete(lock_key)
 
     async def get_video_job_status(self, job_id: str) -> JobStatus:
-        # Check if job is still pending
-        pending_data = self.redis_client.get(f"job:{job_id}:pending")
-        if pending_data:
-            pending_job = self._deserialize(pending_data)
-            return JobStatus(
-                status="waiting",
-                job_start_time=datetime.fromisoformat(pending_job["job_start_time"]),
-                job_end_time=None,
-                video_url=None,
-            )
-        
-        # Check if job failed
-        error_data = self.redis_client.get(f"job:{job_id}:error")
-        if error_data:
-            error_job = self._deserialize(error_data)
+        """Read job status purely from Redis, the poller keeps the record up to date"""
+        return self._job_status(await self._get_job(job_id))
+
+    async def get_video_job_statuses(self, job_ids: list[str]) -> dict[str, Optional[JobStatus]]:
+        """
+        Status of many jobs in one pipelined round trip (no MULTI, the reads are independent).
+        Missing jobs map to None; a record that can't be decoded maps to an error status for that job only.
+        """
+        job_ids = list(dict.fromkeys(job_ids))
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hgetall(self._job_key(job_id))
+            records = await pipe.execute()
+
+        statuses = {}
+        for job_id, raw in zip(job_ids, records):
+            try:
+                statuses[job_id] = self._job_status(self._decode_job(raw))
+            except Exception as e:
+                print(f"Error reading video job {job_id}: {e}")
+                statuses[job_id] = JobStatus(job_start_time=None, status="error", error="Job record is unreadable")
+        return statuses
+
+    def _job_status(self, job: Optional[VideoJob]) -> Optional[JobStatus]:
+        if job is None: # if job not found
+            return None
+
+        job_start_time = datetime.fromisoformat(job["job_start_time"])
+
+        if job["state"] == "error":
             return JobStatus(
                 status="error",
-                job_start_time=datetime.fromisoformat(error_job["job_start_time"]),
+                job_start_time=job_start_time,
                 job_end_time=None,
                 video_url=None,
-                error=error_job.get("error")
+                error=job.get("error")
             )
-        
-        # Retrieve actual job from Redis
-        job_data = self.redis_client.get(f"job:{job_id}")
-
-        if job_data is None: # if job not found
-            return None
 
-        job = self._deserialize(job_data)
-
-        # Use operation_name instead of full operation object
-        result = await self.vertex_service.get_video_status_by_name(job["operation_name"])
+        if job["state"] == "done":
+            return JobStatus(
+                status="done",
+                job_start_time=job_start_time,
+                job_end_time=datetime.fromisoformat(job["job_end_time"]),
+                video_url=job["video_url"],
+                metadata=job.get("metadata")
+            )
 
-        ret = JobStatus(
-            status=result.status,
-            job_start_time=datetime.fromisoformat(job["job_start_time"]),
-            job_end_time=datetime.now() if result.status == "done" else None,
-            video_url=result.video_url.replace("gs://", "https://storage.googleapis.com/") if result.video_url else None,
+        # pending, analyzing or generating
+        return JobStatus(
+            status="waiting",
+            job_start_time=job_start_time,
+            job_end_time=None,
+            video_url=None,
             metadata=job.get("metadata")
         )
 
-        if result.status == "done":
-            self.redis_client.delete(f"job:{job_id}") # clean from redis
-
-        return ret
-
     async def redis_health_check(self) -> bool:
+        return await self.redis_service.health_check()
+        
+    async def _listen_job_events(self):
+        """Fan job state notifications from Redis pub/sub out to local watchers"""
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(EVENTS_PATTERN)
+                async for message in pubsub.listen():
+                    job_id = message["channel"].decode().split(":")[1]
+                    for queue in self._watchers.get(job_id, ()):
+                        queue.put_nowait(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job event listener disconnected: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def watch_video_job(self, job_id: str) -> AsyncIterator[Optional[VideoJob]]:
+        """
+        Yield the job record on every state change until it is done or errored.
+        Yields None when nothing happened for JOB_EVENTS_KEEPALIVE seconds so streams can send a keep-alive;
+        the record is re-read then as well, so a missed notification only delays an update.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._watchers.setdefault(job_id, set()).add(queue)
         try:
-            self.redis_client.ping()
-            return True
-        except redis.RedisError:
-            return False
-        
\ No newline at end of file
+            last_state = None
+            while True:
+                job = await self._get_job(job_id)
+                if job is None: # expired
+                    return
+                if job["state"] != last_state:
+                    last_state = job["state"]
+                    yield job
+                    if last_state in TERMINAL_STATES:
+                        return
+                try:
+                    await asyncio.wait_for(queue.get(), timeout=settings.JOB_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(queue)
+                if not watchers:
+                    del self._watchers[job_id]
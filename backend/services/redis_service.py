@@ -0,0 +1,60 @@
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from typing import Optional
+from utils import metrics
+from utils.env import settings
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        with metrics.span("redis", "PIPELINE"):
+            return await super().execute(raise_on_error)
+
+class InstrumentedRedis(redis.Redis):
+    """redis.Redis that times every command (and pipeline round trip) into the dependency metrics"""
+    async def execute_command(self, *args, **options):
+        command = args[0].decode() if isinstance(args[0], bytes) else str(args[0])
+        with metrics.span("redis", command.upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class RedisService:
+    """
+    Owns the shared redis.asyncio connection pool.
+    The pool is created on app startup and closed on shutdown (see server.py),
+    every service that needs Redis borrows connections from it.
+    """
+    def __init__(self):
+        self.pool: Optional[redis.BlockingConnectionPool] = None
+        self.client: Optional[redis.Redis] = None
+
+    async def start(self):
+        if self.client:
+            return
+        # BlockingConnectionPool makes callers wait for a free connection
+        # (up to REDIS_POOL_TIMEOUT) instead of failing when the pool is exhausted
+        self.pool = redis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            decode_responses=False,
+        )
+        self.client = InstrumentedRedis(connection_pool=self.pool)
+
+    async def stop(self):
+        if self.client:
+            await self.client.aclose()
+        if self.pool:
+            await self.pool.aclose()
+        self.client = None
+        self.pool = None
+
+    async def health_check(self) -> bool:
+        try:
+            return bool(await self.client.ping())
+        except (redis.RedisError, AttributeError):
+            return False
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+import httpx
+from utils.env import settings
+from utils.metrics import span
+
+# only our own bucket objects are cached, anything else is handed to ffmpeg as-is
+CACHEABLE_PREFIX = "https://storage.googleapis.com/"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# a partial file not written to for this long belongs to a download or merge that died
+PART_STALE_SECONDS = 10 * 60
+
+class SegmentCacheService:
+    """
+    On-disk LRU cache of video clips used as merge inputs.
+    Files are keyed by object URL plus its GCS generation (or ETag), so a re-generated clip under
+    the same URL is never served stale. Missing clips are prefetched in parallel and ffmpeg reads
+    local files, so re-merging a storyboard only downloads the clips that changed.
+    """
+    def __init__(self):
+        self.cache_dir = settings.SEGMENT_CACHE_DIR or os.path.join(tempfile.gettempdir(), "flowboard-segments")
+        self.client: Optional[httpx.AsyncClient] = None
+        self._downloads: dict[str, asyncio.Task] = {}
+        # files handed to a running merge, never evicted while in use
+        self._in_use: Counter[str] = Counter()
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # drop what a killed process left behind before anything is pinned
+        await asyncio.to_thread(self._evict, frozenset())
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(max_connections=settings.SEGMENT_CACHE_PREFETCH_CONCURRENCY * 2),
+                follow_redirects=True,
+            )
+
+    async def stop(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    @asynccontextmanager
+    async def local_inputs(self, video_urls: list[str]):
+        """
+        Yield merge inputs in order: a local path for every clip that is (now) cached,
+        the original URL for clips that can't be cached. Yielded files are pinned until exit.
+        """
+        semaphore = asyncio.Semaphore(settings.SEGMENT_CACHE_PREFETCH_CONCURRENCY)
+        with span("ffmpeg", "prefetch"):
+            inputs = await asyncio.gather(*(self._resolve(url, semaphore) for url in video_urls))
+        with self.pinned([path for path in inputs if self.key_for(path)]):
+            # the Counter is changed on the loop, the thread only gets a copy
+            await asyncio.to_thread(self._evict, frozenset(self._in_use))
+            yield list(inputs)
+
+    @contextmanager
+    def pinned(self, paths: list[str]):
+        """Keep `paths` from being evicted until exit"""
+        self._in_use.update(paths)
+        try:
+            yield
+        finally:
+            self._in_use.subtract(paths)
+            self._in_use += Counter()  # drop zero counts
+
+    def key_for(self, path: str) -> Optional[str]:
+        """Content key of a cached clip (derived from URL + generation), None for inputs that aren't cached"""
+        if not path.startswith(self.cache_dir + os.sep):
+            return None
+        return os.path.basename(path).removesuffix(".mp4")
+
+    def new_output_path(self) -> str:
+        """Path for a file produced locally (e.g. a merged video), evicted like any other cached file"""
+        return os.path.join(self.cache_dir, f"merged-{uuid.uuid4()}.mp4")
+
+    async def _resolve(self, url: str, semaphore: asyncio.Semaphore) -> str:
+        if not url.startswith(CACHEABLE_PREFIX):
+            return url
+        try:
+            async with semaphore:
+                version = await self._object_version(url)
+            key = hashlib.sha256(f"{url}\0{version}".encode()).hexdigest()
+            path = os.path.join(self.cache_dir, f"{key}.mp4")
+            if os.path.exists(path):
+                self.hits += 1
+                os.utime(path)  # mark as recently used
+                return path
+
+            self.misses += 1
+            # merges asking for the same clip at the same time share one download
+            download = self._downloads.get(key)
+            if download is None:
+                download = asyncio.create_task(self._download(url, path, semaphore))
+                self._downloads[key] = download
+                download.add_done_callback(lambda _: self._downloads.pop(key, None))
+            await asyncio.shield(download)
+            return path
+        except Exception as e:
+            # fall back to letting ffmpeg read the URL
+            print(f"Segment cache miss for {url}: {e}")
+            return url
+
+    async def _object_version(self, url: str) -> str:
+        response = await self.client.head(url)
+        response.raise_for_status()
+        version = response.headers.get("x-goog-generation") or response.headers.get("etag")
+        if not version:
+            raise ValueError("no generation or ETag header")
+        return version
+
+    async def _download(self, url: str, path: str, semaphore: asyncio.Semaphore):
+        tmp_path = f"{path}.{os.getpid()}.part"
+        try:
+            async with semaphore:
+                async with self.client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    with open(tmp_path, "wb") as f:
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            await asyncio.to_thread(f.write, chunk)
+            # atomic, readers never see a partial file
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict(self, pinned: frozenset[str]):
+        """
+        Delete least recently used files, except `pinned`, until the cache fits in SEGMENT_CACHE_MAX_BYTES.
+        Partial files count towards the size, abandoned ones are deleted.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".part"):
+                    stat = entry.stat()
+                    if self._abandoned(entry.name, stat.st_mtime, now):
+                        self._remove(entry.path)
+                    else:
+                        total += stat.st_size
+                elif entry.name.endswith(".mp4"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= settings.SEGMENT_CACHE_MAX_BYTES:
+                break
+            if path in pinned:
+                continue
+            self._remove(path)
+            total -= size
+
+    def _abandoned(self, name: str, mtime: float, now: float) -> bool:
+        """Whether a .part file is left over: not written to for a while, or tagged with a pid that is gone"""
+        if now - mtime > PART_STALE_SECONDS:
+            return True
+        # {key}.mp4.{pid}.part from _download; merge outputs carry no pid and only go stale
+        pid = name.removesuffix(".part").rsplit(".", 1)[-1]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # alive, owned by someone else
+        return False
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "pinned_files": len(self._in_use)}
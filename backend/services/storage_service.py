@@ -1,5 +1,8 @@
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import storage
+from typing import IO, AsyncIterator, Tuple
 from utils.env import settings
+import asyncio
 import os
 
 class StorageService:
@@ -51,6 +54,53 @@ class StorageService:
         blob = self.bucket.blob(item_name)
         blob.upload_from_string(file_data)
         
+        return self._public_url(blob, item_name)
+
+    async def upload_stream(self, item_name: str, chunks: AsyncIterator[bytes], content_type: str = "video/mp4") -> Tuple[str, int]:
+        """
+        Stream chunks into a GCS resumable upload. Memory stays bounded by GCS_UPLOAD_CHUNK_SIZE
+        however large the object is. Returns (public_url, size in bytes).
+        If `chunks` raises, the upload is abandoned and no object is created.
+        """
+        if not self.bucket:
+            raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
+
+        blob = self.bucket.blob(item_name, chunk_size=settings.GCS_UPLOAD_CHUNK_SIZE)
+        # BlobWriter is blocking, every call that may hit the network runs in a thread
+        writer = await asyncio.to_thread(blob.open, "wb", content_type=content_type)
+        size = 0
+        async for chunk in chunks:
+            await asyncio.to_thread(writer.write, chunk)
+            size += len(chunk)
+        # only closing the writer finalizes the object, so a failed stream never leaves a truncated file
+        await asyncio.to_thread(writer.close)
+
+        return await asyncio.to_thread(self._public_url, blob, item_name), size
+
+    async def upload_media(self, file: IO[bytes], sha256: str, content_type: str) -> str:
+        """
+        Upload media that is only read by Vertex/Gemini (not served publicly) and return its gs:// URI.
+        Objects are named by content hash, so the same clip is uploaded once however often it is analyzed.
+        """
+        if not self.bucket:
+            raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
+
+        item_name = f"media/{sha256}"
+        blob = self.bucket.blob(item_name, chunk_size=settings.GCS_UPLOAD_CHUNK_SIZE)
+
+        def upload():
+            if blob.exists():
+                return
+            try:
+                # only create, a concurrent upload of the same content may have won the race
+                blob.upload_from_file(file, content_type=content_type, rewind=True, if_generation_match=0)
+            except PreconditionFailed:
+                pass
+
+        await asyncio.to_thread(upload)
+        return f"gs://{self.bucket.name}/{item_name}"
+
+    def _public_url(self, blob, item_name: str) -> str:
         # Try to make the blob publicly readable
         # If uniform bucket-level access is enabled, this will fail
         try:
@@ -1,24 +1,135 @@
-from supabase import Client, create_client
+import asyncio
+import time
+from datetime import datetime, timezone
+import httpx
+import jwt
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
 from utils.env import settings
+from utils.metrics import traced
+from utils.ttl_cache import TTLCache
 from typing import Optional, Tuple
 from blacksheep import Request
 
+# algorithms Supabase signs access tokens with (legacy shared secret, asymmetric signing keys)
+JWT_ALGORITHMS = ("HS256", "RS256", "ES256")
+JWT_AUDIENCE = "authenticated"
+
 
 class SupabaseService:
     def __init__(self):
-        self.supabase: Client = create_client(
-            settings.SUPABASE_URL, settings.SUPABASE_SECRET_KEY
+        # created in start(), the async client needs a running loop
+        self.supabase: Optional[AsyncClient] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+        # token -> user id ("" for a rejected token), entries expire with the token
+        self._token_cache = TTLCache(max_items=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL)
+        self._jwks_client = jwt.PyJWKClient(
+            f"{settings.SUPABASE_URL}/auth/v1/.well-known/jwks.json",
+            lifespan=settings.AUTH_JWKS_TTL,
+            timeout=5,
         )
+        # after a failed JWKS fetch, don't retry it on every request
+        self._jwks_retry_at = 0.0
+        # user id -> billing_type, only used to prioritise Vertex calls so a few minutes stale is fine
+        self._billing_type_cache = TTLCache(max_items=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.BILLING_TYPE_CACHE_TTL)
     
-    def get_user_id_from_token(self, token: str) -> Optional[str]:
+    async def start(self):
+        # one keep-alive pool shared by PostgREST and GoTrue calls
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.SUPABASE_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPABASE_MAX_CONNECTIONS,
+            ),
+            http2=True,
+            follow_redirects=True,
+        )
+        self.supabase = await acreate_client(
+            settings.SUPABASE_URL,
+            settings.SUPABASE_SECRET_KEY,
+            options=AsyncClientOptions(
+                httpx_client=self.http_client,
+                # service-role client, there is no user session to keep
+                auto_refresh_token=False,
+                persist_session=False,
+            ),
+        )
+
+    async def stop(self):
+        if self.http_client:
+            await self.http_client.aclose()
+            self.http_client = None
+        self.supabase = None
+
+    async def get_user_id_from_token(self, token: str) -> Optional[str]:
         """Return the Supabase user id from a JWT access token.
-        Uses GoTrue to validate the token and fetch the user.
+        The token is verified locally (shared secret or cached JWKS signing keys) and the result is
+        cached until the token expires. GoTrue is only asked when the token can't be verified locally.
         Returns None if invalid or user not found.
         """
         if not token:
             return None
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            return cached or None
+
+        try:
+            claims = await self._verify_token(token)
+        except jwt.InvalidTokenError:
+            self._token_cache.set(token, "", ttl=settings.AUTH_INVALID_TOKEN_CACHE_TTL)
+            return None
+
+        if claims is not None:
+            user_id = claims["sub"]
+            expires_in = claims["exp"] - time.time()
+        else:
+            user_id = await self._get_user_id_remote(token)
+            try:
+                expires_in = jwt.decode(token, options={"verify_signature": False})["exp"] - time.time()
+            except Exception:
+                expires_in = settings.AUTH_INVALID_TOKEN_CACHE_TTL
+        ttl = settings.AUTH_TOKEN_CACHE_TTL if user_id else settings.AUTH_INVALID_TOKEN_CACHE_TTL
+        self._token_cache.set(token, user_id or "", ttl=min(ttl, expires_in))
+        return user_id
+
+    async def _verify_token(self, token: str) -> Optional[dict]:
+        """
+        Verify signature, expiry and audience, return the claims.
+        Raises jwt.InvalidTokenError for a bad token, returns None when there is no key to check it with.
+        """
+        algorithm = jwt.get_unverified_header(token).get("alg")
+        if algorithm not in JWT_ALGORITHMS:
+            raise jwt.InvalidAlgorithmError(f"Unexpected token algorithm {algorithm}")
+        if algorithm == "HS256":
+            if not settings.SUPABASE_JWT_SECRET:
+                return None
+            key = settings.SUPABASE_JWT_SECRET
+        else:
+            if time.monotonic() < self._jwks_retry_at:
+                return None
+            try:
+                # PyJWKClient fetches the JWKS with blocking urllib when its cache is cold or misses the kid
+                key = (await asyncio.to_thread(self._jwks_client.get_signing_key_from_jwt, token)).key
+            except jwt.PyJWKClientConnectionError as e:
+                print(f"Could not fetch JWKS, falling back to GoTrue: {e}")
+                self._jwks_retry_at = time.monotonic() + settings.AUTH_INVALID_TOKEN_CACHE_TTL
+                return None
+            except jwt.PyJWKClientError as e:
+                # unknown key id, e.g. keys rotated on the Supabase side
+                print(f"Could not get JWT signing key, falling back to GoTrue: {e}")
+                return None
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=JWT_AUDIENCE,
+            options={"require": ["exp", "sub"]},
+        )
+
+    @traced("supabase")
+    async def _get_user_id_remote(self, token: str) -> Optional[str]:
+        """Validate the token with GoTrue (a network round trip)"""
         try:
-            res = self.supabase.auth.get_user(token)
+            res = await self.supabase.auth.get_user(token)
             # supabase-py v2: res has `.user` with `.id`
             if getattr(res, "user", None) and getattr(res.user, "id", None):
                 return res.user.id
@@ -26,7 +137,7 @@ class SupabaseService:
         except Exception:
             return None
 
-    def get_user_id_from_request(self, request: Request) -> Optional[str]:
+    async def get_user_id_from_request(self, request: Request) -> Optional[str]:
         """Extract Bearer token from Authorization header and return user id."""
         auth_header = request.get_first_header(b"authorization")
         if not auth_header:
@@ -38,29 +149,27 @@ class SupabaseService:
             else:
                 # Not a Bearer token
                 return None
-            return self.get_user_id_from_token(token)
+            return await self.get_user_id_from_token(token)
         except Exception:
             return None
 
-    def do_transaction(self, user_id: str, transaction_type: str, credit_usage: int) -> Tuple[bool, Optional[str]]:
+    @traced("supabase")
+    async def do_transaction(self, user_id: str, transaction_type: str, credit_usage: int) -> Tuple[bool, Optional[str]]:
         """
         Logs transaction and deducts credit usage for user.
+        One RPC (debit_user_credits, see scripts/db/functions.sql), so the debit and the log row
+        are written together or not at all.
         Returns (success, error_message) tuple.
         """
         try:
-            self.supabase.rpc(
-                "sub_user_credits",
+            await self.supabase.rpc(
+                "debit_user_credits",
                 {
                     "p_user_id": user_id,
-                    "p_credit_change": credit_usage
+                    "p_transaction_type": transaction_type,
+                    "p_credit_usage": credit_usage
                 }
             ).execute()
-
-            self.supabase.table("transaction_log").insert({
-                "transaction_type": transaction_type,
-                "user_id": user_id,
-                "credit_usage": credit_usage
-            }).execute()
             return (True, None)
         except Exception as e:
             error_msg = str(e)
@@ -69,10 +178,11 @@ class SupabaseService:
                 return (False, "insufficient_credits")
             return (False, error_msg)
         
-    def get_user_row(self, user_id: str):
+    @traced("supabase")
+    async def get_user_row(self, user_id: str):
         """ fetches user row """
         try:
-            return (
+            return await (
                 self.supabase
                 .table("profiles")    
                 .select("*")
@@ -83,10 +193,40 @@ class SupabaseService:
         except Exception:
             return None
 
-    def get_transaction_log(self, user_id: str):
+    async def is_paid_user(self, user_id: str) -> bool:
+        """Whether the user is on the paid plan (profiles.billing_type), cached for BILLING_TYPE_CACHE_TTL"""
+        billing_type = self._billing_type_cache.get(user_id)
+        if billing_type is None:
+            billing_type = await self._get_billing_type(user_id)
+            if billing_type is None:
+                # lookup failed, treat as free without caching it
+                return False
+            self._billing_type_cache.set(user_id, billing_type)
+        return billing_type == "paid"
+
+    @traced("supabase")
+    async def _get_billing_type(self, user_id: str) -> Optional[str]:
+        try:
+            res = await (
+                self.supabase
+                .table("profiles")
+                .select("billing_type")
+                .eq("user_id", user_id)
+                .maybe_single()
+                .execute()
+            )
+        except Exception as e:
+            print(f"Failed to fetch billing type: {e}")
+            return None
+        if not res or not res.data:
+            return "free"
+        return res.data.get("billing_type") or "free"
+
+    @traced("supabase")
+    async def get_transaction_log(self, user_id: str):
         """ fetches transaction log for user """
         try:
-            return (
+            return await (
                 self.supabase
                 .table("transaction_log")    
                 .select("*")
@@ -97,49 +237,29 @@ class SupabaseService:
         except Exception:
             return None
 
-    def add_user_credits(self, user_id: str, credits: int):
+    @traced("supabase")
+    async def apply_credit_purchase(
+        self, user_id: str, credits: int, purchase_id: str, paid_at: float
+    ) -> Optional[Tuple[float, bool]]:
         """
-        Add credits to user account (opposite of sub_user_credits).
-        Uses a negative value with the existing subtract function to add credits.
+        Add purchased credits, switch the user to the paid plan and log the purchase in one RPC
+        (apply_credit_purchase, see scripts/db/functions.sql). A purchase_id that was already
+        applied, or paid (unix seconds) before the rollout of applied_purchases, changes nothing.
+        Returns (balance, applied by this call), or None if the call failed.
         """
         try:
-            self.supabase.rpc(
-                "sub_user_credits",
+            res = await self.supabase.rpc(
+                "apply_credit_purchase",
                 {
                     "p_user_id": user_id,
-                    "p_credit_change": -credits  # Negative to add credits
+                    "p_credits": credits,
+                    "p_purchase_id": purchase_id,
+                    "p_paid_at": datetime.fromtimestamp(paid_at, timezone.utc).isoformat(),
                 }
             ).execute()
-            return True
+            self._billing_type_cache.pop(user_id)
+            row = res.data[0] if isinstance(res.data, list) else res.data
+            return (row["balance"], row["applied"])
         except Exception as e:
-            print(f"Failed to add credits: {e}")
-            return False
-
-    def update_user_plan(self, user_id: str, plan: str):
-        """
-        Update user's billing plan (free or paid).
-        """
-        try:
-            self.supabase.table("profiles").update({
-                "billing_type": plan  # Column is billing_type, not plan
-            }).eq("user_id", user_id).execute()
-            return True
-        except Exception as e:
-            print(f"Failed to update plan: {e}")
-            return False
-
-    def log_credit_purchase(self, user_id: str, credits: int, product_id: str):
-        """
-        Log a credit purchase transaction.
-        """
-        try:
-            self.supabase.table("transaction_log").insert({
-                "transaction_type": "credit_purchase",  # Must be a valid enum value
-                "user_id": user_id,
-                "credit_usage": -credits,  # Negative because user gained credits
-            }).execute()
-            return True
-        except Exception as e:
-            print(f"Failed to log credit purchase: {e}")
-            return False
-        
+            print(f"Failed to apply credit purchase: {e}")
+            return None
@@ -0,0 +1,151 @@
+import asyncio
+import heapq
+import itertools
+import random
+from contextvars import ContextVar
+from typing import Awaitable, Callable, TypeVar
+from google.genai import errors
+from services.redis_service import RedisService
+from utils.env import settings
+
+T = TypeVar("T")
+
+PRIORITY_PAID = 0
+PRIORITY_FREE = 1
+# priority of the Vertex calls made by the current request / job, lower is served first
+request_priority: ContextVar[int] = ContextVar("vertex_request_priority", default=PRIORITY_FREE)
+
+# token bucket shared by every replica, refilled from the Redis clock so replica clock skew doesn't matter.
+# Takes a token if one is available; returns the seconds until one will be otherwise.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# empty the bucket and put it ARGV[2] seconds in debt, so every replica holds off the model
+PENALIZE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local debt = -tonumber(ARGV[1]) * tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], 'tokens', tostring(debt), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])) + 60)
+return 1
+"""
+
+class VertexRateLimitError(Exception):
+    """Raised when a Vertex call waited longer than VERTEX_QUEUE_TIMEOUT for its turn"""
+
+class VertexRateLimiter:
+    """
+    Client-side quota for Vertex models: one token bucket per model in Redis (VERTEX_RATE_LIMITS,
+    requests per minute across all replicas), so bursts queue here instead of failing upstream.
+    Waiting calls are served by priority, paid users first (see request_priority), and a 429 that gets
+    through anyway drains the bucket and is retried with jittered backoff.
+    """
+    def __init__(self, redis_service: RedisService):
+        self.redis_service = redis_service
+        # model -> heap of (priority, arrival, future) waiting for a token
+        self._waiters: dict[str, list[tuple[int, int, asyncio.Future]]] = {}
+        # model -> task handing out tokens to the waiters, running while anyone waits
+        self._dispatchers: dict[str, asyncio.Task] = {}
+        self._arrivals = itertools.count()
+        self._acquire_script = None
+        self._penalize_script = None
+
+    def _bucket_key(self, model: str) -> str:
+        return f"ratelimit:vertex:{model}"
+
+    def _limit(self, model: str) -> float:
+        """Requests per minute for `model`, 0 when it isn't limited"""
+        if not settings.VERTEX_RATE_LIMIT_ENABLED:
+            return 0
+        return settings.VERTEX_RATE_LIMITS.get(model, 0)
+
+    async def run(self, model: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Make a Vertex call once `model` has quota for it, retrying with backoff if Vertex answers 429"""
+        attempt = 0
+        while True:
+            await self.acquire(model)
+            try:
+                return await call()
+            except errors.APIError as e:
+                if e.code != 429 or attempt >= settings.VERTEX_MAX_RETRIES:
+                    raise
+            attempt += 1
+            await self._penalize(model)
+            delay = random.uniform(0, settings.VERTEX_RETRY_BASE_DELAY * 2 ** attempt)
+            print(f"Vertex rate limited {model}, retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def acquire(self, model: str):
+        """Wait for a token of `model`, behind every waiter with a higher priority"""
+        limit = self._limit(model)
+        if not limit:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters.setdefault(model, []), (request_priority.get(), next(self._arrivals), future))
+        if model not in self._dispatchers:
+            self._dispatchers[model] = asyncio.create_task(self._dispatch(model, limit))
+        try:
+            # cancels the future on timeout, the dispatcher skips it
+            await asyncio.wait_for(future, settings.VERTEX_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise VertexRateLimitError(f"Timed out waiting for {model} quota, try again later")
+
+    async def _dispatch(self, model: str, limit: float):
+        waiters = self._waiters[model]
+        try:
+            while True:
+                while waiters and waiters[0][2].done():
+                    heapq.heappop(waiters)
+                if not waiters:
+                    return
+                try:
+                    wait = await self._take_token(model, limit)
+                except Exception as e:
+                    # limiter trouble must not stall generation, let the call through
+                    print(f"Vertex rate limiter failed: {e}")
+                    wait = 0
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                while waiters:
+                    _, _, future = heapq.heappop(waiters)
+                    if not future.done():
+                        future.set_result(None)
+                        break
+        finally:
+            del self._dispatchers[model]
+
+    async def _take_token(self, model: str, limit: float) -> float:
+        if self._acquire_script is None:
+            self._acquire_script = self.redis_service.client.register_script(ACQUIRE_SCRIPT)
+        rate = limit / 60
+        capacity = max(1.0, rate * settings.VERTEX_RATE_LIMIT_BURST_SECONDS)
+        return float(await self._acquire_script(keys=[self._bucket_key(model)], args=[rate, capacity]))
+
+    async def _penalize(self, model: str):
+        limit = self._limit(model)
+        if not limit:
+            return
+        if self._penalize_script is None:
+            self._penalize_script = self.redis_service.client.register_script(PENALIZE_SCRIPT)
+        try:
+            await self._penalize_script(keys=[self._bucket_key(model)], args=[limit / 60, settings.VERTEX_RETRY_BASE_DELAY])
+        except Exception as e:
+            print(f"Vertex rate limiter failed: {e}")
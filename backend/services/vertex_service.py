@@ -1,108 +1,204 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
 from google import genai
 from google.genai.types import GenerateVideosConfig, GenerateVideosOperation, Image, GenerateContentConfig, ImageConfig, Part, VideoGenerationReferenceImage
 from models.job import JobStatus
+from services.gemini_cache_service import GeminiCacheService
+from services.storage_service import StorageService
+from services.vertex_rate_limiter import VertexRateLimiter
 from utils.env import settings
+from utils.image import normalize_image
+from utils.metrics import span, traced
+from utils.multipart import SpooledUpload
 
 class VertexService:
-    def __init__(self):
+    def __init__(self, gemini_cache_service: GeminiCacheService, storage_service: StorageService, rate_limiter: VertexRateLimiter):
+        self.gemini_cache_service = gemini_cache_service
+        self.storage_service = storage_service
+        self.rate_limiter = rate_limiter
         self.client = genai.Client(
             vertexai=settings.GOOGLE_GENAI_USE_VERTEXAI,
             project=settings.GOOGLE_CLOUD_PROJECT,
             location=settings.GOOGLE_CLOUD_LOCATION
         )
         self.bucket_name = settings.GOOGLE_CLOUD_BUCKET_NAME
+        # created on first use, most processes (e.g. merge-only traffic) never resize an image
+        self._image_pool: Optional[ProcessPoolExecutor] = None
+
+    async def close(self):
+        await self.client.aio.aclose()
+        if self._image_pool:
+            self._image_pool.shutdown(wait=False, cancel_futures=True)
+            self._image_pool = None
+
+    async def _prepare_image(self, data: bytes) -> tuple[bytes, str]:
+        """Scale, letterbox and re-encode an image for the models (see utils/image.py), returns (bytes, mime type)"""
+        if not settings.IMAGE_NORMALIZE_ENABLED:
+            return data, "image/png"
+        if self._image_pool is None:
+            # spawn, forking a process that runs gRPC / HTTP client threads isn't safe
+            self._image_pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        normalize = functools.partial(
+            normalize_image,
+            data,
+            settings.IMAGE_MAX_WIDTH,
+            settings.IMAGE_MAX_HEIGHT,
+            fit=settings.IMAGE_FIT,
+            quality=settings.IMAGE_JPEG_QUALITY,
+            passthrough_max_bytes=settings.IMAGE_PASSTHROUGH_MAX_BYTES,
+        )
+        # CPU bound, kept off the event loop
+        with span("image", "normalize"):
+            return await asyncio.get_running_loop().run_in_executor(self._image_pool, normalize)
 
     async def generate_video_content(self, prompt: str, image_data: bytes = None, ending_image_data: bytes = None, duration_seconds: int = 6) -> GenerateVideosOperation:
+        image_data, mime_type = await self._prepare_image(image_data)
         ending_frame = None
         if ending_image_data:
+            ending_image_data, ending_mime_type = await self._prepare_image(ending_image_data)
             ending_frame = Image(
                 image_bytes=ending_image_data,
-                mime_type="image/png",
+                mime_type=ending_mime_type,
             )
 
-        # gen vid
-        operation = self.client.models.generate_videos(
-            model="veo-3.1-fast-generate-001",
-            prompt=prompt,
-            image=Image(
-                image_bytes=image_data,
-                mime_type="image/png",
-            ),
-            config=GenerateVideosConfig(
-                aspect_ratio="16:9",
-                duration_seconds=duration_seconds,
-                output_gcs_uri=f"gs://{self.bucket_name}/videos/",
-                negative_prompt="text, captions, subtitles, annotations, low quality, static, ugly, weird physics",
-                last_frame=ending_frame,
-            ),
-        )
+        model = "veo-3.1-fast-generate-001"
+
+        async def generate() -> GenerateVideosOperation:
+            # timed per attempt, time spent waiting for quota is not Vertex latency
+            with span("vertex", "generate_video_content"):
+                return await self.client.aio.models.generate_videos(
+                    model=model,
+                    prompt=prompt,
+                    image=Image(
+                        image_bytes=image_data,
+                        mime_type=mime_type,
+                    ),
+                    config=GenerateVideosConfig(
+                        aspect_ratio="16:9",
+                        duration_seconds=duration_seconds,
+                        output_gcs_uri=f"gs://{self.bucket_name}/videos/",
+                        negative_prompt="text, captions, subtitles, annotations, low quality, static, ugly, weird physics",
+                        last_frame=ending_frame,
+                    ),
+                )
 
-        return operation
+        # gen vid
+        return await self.rate_limiter.run(model, generate)
     
-    async def generate_image_content(self, prompt: str, image: bytes) -> str:
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash-image",
-            contents=[
-                Part.from_bytes(
-                    data=image,
-                    mime_type="image/png",
-                ),
-                prompt,
-            ],
-            config=GenerateContentConfig(
-                response_modalities=["IMAGE"],
-                image_config=ImageConfig(
-                    aspect_ratio="16:9",
-                ),
-                candidate_count=1,
-            ),
-        )
-        if not response.candidates or not response.candidates[0].content.parts:
-            raise Exception(str(response))
-        return response.candidates[0].content.parts[0].inline_data.data
+    async def generate_image_content(self, prompt: str, image: bytes) -> bytes:
+        model = "gemini-2.5-flash-image"
+
+        async def call(data: bytes, mime_type: str):
+            # timed here rather than around the method, so Gemini cache hits and quota waits don't count as Vertex latency
+            with span("vertex", "generate_image_content"):
+                return await self.client.aio.models.generate_content(
+                    model=model,
+                    contents=[
+                        Part.from_bytes(
+                            data=data,
+                            mime_type=mime_type,
+                        ),
+                        prompt,
+                    ],
+                    config=GenerateContentConfig(
+                        response_modalities=["IMAGE"],
+                        image_config=ImageConfig(
+                            aspect_ratio="16:9",
+                        ),
+                        candidate_count=1,
+                    ),
+                )
+
+        async def generate() -> bytes:
+            data, mime_type = await self._prepare_image(image)
+            response = await self.rate_limiter.run(model, functools.partial(call, data, mime_type))
+            if not response.candidates or not response.candidates[0].content.parts:
+                raise Exception(str(response))
+            return response.candidates[0].content.parts[0].inline_data.data
+
+        return await self.gemini_cache_service.get_or_compute(model, prompt, image, generate)
     
+    @traced("vertex")
     async def get_video_status(self, operation: GenerateVideosOperation) -> JobStatus:
-        operation = self.client.operations.get(operation)
+        operation = await self.client.aio.operations.get(operation)
         if operation.done and operation.result and operation.result.generated_videos:
             return JobStatus(status="done", job_start_time=None, video_url=operation.result.generated_videos[0].video.uri)
         return JobStatus(status="waiting", job_start_time=None, video_url=None)
     
+    @traced("vertex")
     async def get_video_status_by_name(self, operation_name: str) -> JobStatus:
         """Get video status by operation name (avoids serialization)"""
         # Create a minimal operation object with just the name since get() expects an operation object
         operation = GenerateVideosOperation(name=operation_name)
-        operation = self.client.operations.get(operation)
+        operation = await self.client.aio.operations.get(operation)
         if operation.done and operation.result and operation.result.generated_videos:
             return JobStatus(status="done", job_start_time=None, video_url=operation.result.generated_videos[0].video.uri)
+        if operation.done:
+            # finished without a video (upstream error or every sample filtered)
+            error = operation.error or "No video was generated"
+            return JobStatus(status="error", job_start_time=None, video_url=None, error=str(error))
         return JobStatus(status="waiting", job_start_time=None, video_url=None)
     
-    def analyze_video_content(self, prompt: str, video_data: bytes) -> dict:
-        return self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[
-                Part.from_bytes(
-                    data=video_data.data,
-                    mime_type="video/mp4",
-                ),
-                prompt
-                ]
-        )
+    async def analyze_video_content(self, prompt: str, video: SpooledUpload) -> dict:
+        model = "gemini-2.0-flash"
+        contents = [
+            await self._media_part(
+                video,
+                mime_type=video.content_type if (video.content_type or "").startswith("video/") else "video/mp4",
+            ),
+            prompt
+        ]
+
+        async def analyze():
+            with span("vertex", "analyze_video_content"):
+                return await self.client.aio.models.generate_content(model=model, contents=contents)
+
+        return await self.rate_limiter.run(model, analyze)
+
+    async def _media_part(self, upload: SpooledUpload, mime_type: str) -> Part:
+        """
+        Small media is sent inline. Larger media is uploaded to the bucket once (keyed by content hash)
+        and referenced by gs:// URI, so the request stays small and retries don't resend the bytes.
+        """
+        if upload.size > settings.GEMINI_INLINE_MAX_BYTES and self.storage_service.bucket:
+            uri = await self.storage_service.upload_media(upload.file, upload.sha256.hexdigest(), mime_type)
+            return Part.from_uri(file_uri=uri, mime_type=mime_type)
+        # the upload stays spooled until the request is built
+        return Part.from_bytes(data=await upload.read(), mime_type=mime_type)
     
-    async def analyze_image_content(self, prompt: str, image_data: bytes) -> dict:
-        return self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[
-                Part.from_bytes(
-                    data=image_data,
-                    mime_type="image/png",
-                ),
-                prompt
-                ]
-        ).candidates[0].content.parts[0].text.strip()
+    async def analyze_image_content(self, prompt: str, image_data: bytes) -> str:
+        model = "gemini-2.0-flash"
+
+        async def call(data: bytes, mime_type: str):
+            with span("vertex", "analyze_image_content"):
+                return await self.client.aio.models.generate_content(
+                    model=model,
+                    contents=[
+                        Part.from_bytes(
+                            data=data,
+                            mime_type=mime_type,
+                        ),
+                        prompt
+                        ]
+                )
+
+        async def analyze() -> bytes:
+            data, mime_type = await self._prepare_image(image_data)
+            response = await self.rate_limiter.run(model, functools.partial(call, data, mime_type))
+            return response.candidates[0].content.parts[0].text.strip().encode()
+
+        result = await self.gemini_cache_service.get_or_compute(model, prompt, image_data, analyze)
+        return result.decode()
     
 
+    @traced("vertex")
     async def test_service(self):
-        return self.client.models.generate_content(
+        return await self.client.aio.models.generate_content(
             model="gemini-2.0-flash",
             contents="Hi there, does u work?",
         )
@@ -1,12 +1,148 @@
 import asyncio
+import os
 import time
+from collections import OrderedDict, deque
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Optional
+from services.redis_service import RedisService
 from services.storage_service import StorageService
+from services.segment_cache_service import SegmentCacheService
+from utils import codec
+from utils import metrics
+from utils.env import settings
+from utils.metrics import span
 import uuid
 import shutil
 
+# how much ffmpeg stderr to keep for error messages
+STDERR_TAIL_BYTES = 64 * 1024
+# reusing a single clip is no cheaper than reading the clip itself
+MIN_REUSED_PREFIX = 2
+
+class MergeQueueFullError(Exception):
+    """Raised when a merge can't be queued, `status` is the HTTP status to answer with (429 or 503)"""
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+class MergeScheduler:
+    """
+    Caps the number of concurrent ffmpeg processes and queues the rest in a bounded wait queue.
+    Queued merges are granted round-robin across users, so one user's batch can't monopolize the box.
+    Running merges, queue depth, waits and rejections are exported as video_merge* metrics.
+    """
+    def __init__(self, max_concurrent: int, max_queue: int, max_queued_per_user: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.running = 0
+        self.queued = 0
+        # user_id -> waiting futures; dict order is the round-robin order
+        self._queues: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        wait_start = time.monotonic()
+        if self.running < self.max_concurrent and not self.queued:
+            self.running += 1
+            self._report()
+        else:
+            await self._wait_for_slot(user_id)
+
+        wait = time.monotonic() - wait_start
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        metrics.MERGE_WAIT.observe(wait)
+        try:
+            yield
+        finally:
+            self.completed += 1
+            self._release()
+
+    async def _wait_for_slot(self, user_id: str):
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            metrics.MERGE_REJECTED.labels("queue_full").inc()
+            raise MergeQueueFullError("Merge queue is full, please try again shortly", 503)
+        user_queue = self._queues.get(user_id)
+        if user_queue and len(user_queue) >= self.max_queued_per_user:
+            self.rejected += 1
+            metrics.MERGE_REJECTED.labels("user_limit").inc()
+            raise MergeQueueFullError("Too many merges queued, wait for the current ones to finish", 429)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        self._report()
+        try:
+            # resolved by _release, which hands its running slot over to us
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted just as we were cancelled, pass it on
+                self._release()
+            else:
+                user_queue = self._queues.get(user_id)
+                if user_queue is not None and future in user_queue:
+                    user_queue.remove(future)
+                    self.queued -= 1
+                    if not user_queue:
+                        del self._queues[user_id]
+                    self._report()
+            raise
+
+    def _release(self):
+        while self._queues:
+            user_id, user_queue = next(iter(self._queues.items()))
+            future = user_queue.popleft()
+            self.queued -= 1
+            if user_queue:
+                # this user goes to the back of the rotation
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not future.done():
+                future.set_result(None)
+                self._report()
+                return
+        self.running -= 1
+        self._report()
+
+    def _report(self):
+        metrics.MERGES_RUNNING.set(self.running)
+        metrics.MERGE_QUEUE_DEPTH.set(self.queued)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queue_depth": self.queued,
+            "queued_users": len(self._queues),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.total_wait / self.completed if self.completed else 0.0,
+            "max_wait_seconds": self.max_wait,
+        }
+
 class VideoMergeService:
-    def __init__(self, storage_service: StorageService):
+    def __init__(
+        self,
+        storage_service: StorageService,
+        segment_cache_service: SegmentCacheService,
+        redis_service: RedisService,
+    ):
         self.storage_service = storage_service
+        self.segment_cache_service = segment_cache_service
+        self.redis_service = redis_service
+        self.scheduler = MergeScheduler(
+            max_concurrent=settings.MERGE_MAX_CONCURRENT or os.cpu_count() or 1,
+            max_queue=settings.MERGE_MAX_QUEUE,
+            max_queued_per_user=settings.MERGE_MAX_QUEUED_PER_USER,
+        )
         # Check if ffmpeg is available
         self._check_ffmpeg()
 
@@ -40,32 +176,131 @@ class VideoMergeService:
             # Single video, just return the URL
             return video_urls[0]
         
+        # FFmpeg output is streamed straight into a GCS resumable upload,
+        # so memory per merge is bounded by the chunk sizes, not by the video length
+        video_id = str(uuid.uuid4())
+        video_path = f"videos/{user_id}/merged_{video_id}.mp4"
+
+        # raises MergeQueueFullError when the wait queue is full
+        async with self.scheduler.slot(user_id):
+            # clips already on local disk are read from there, the rest are prefetched in parallel
+            async with self.segment_cache_service.local_inputs(video_urls) as video_inputs:
+                if not settings.MERGE_INCREMENTAL:
+                    with span("ffmpeg", "concat_upload"):
+                        async with aclosing(self._merge_with_ffmpeg_http(video_inputs)) as chunks:
+                            public_url, merged_size = await self.storage_service.upload_stream(video_path, chunks)
+                else:
+                    public_url, merged_size = await self._merge_incremental(video_inputs, video_path, user_id)
+
+        total_duration = time.time() - start_time
+        print(f"[VIDEO MERGE] Merged {len(video_urls)} videos for user {user_id}: {merged_size} bytes in {total_duration:.2f}s")
+
+        return public_url
+
+    async def _merge_incremental(self, video_inputs: list[str], video_path: str, user_id: str) -> tuple[str, int]:
+        """
+        Merge against the user's previous merge manifest: if the timeline starts with the same clips,
+        the previous output is cut at the end of that prefix and only the remaining clips are appended.
+        A fully unchanged timeline returns the previous URL without running FFmpeg.
+        Returns (public_url, size), size is 0 when nothing was merged.
+        """
+        keys = [self.segment_cache_service.key_for(path) for path in video_inputs]
+        previous = await self._load_manifest(user_id)
+
+        prefix = 0
+        if previous:
+            for key, previous_key in zip(keys, previous["clips"]):
+                if key is None or key != previous_key:
+                    break
+                prefix += 1
+            if prefix == len(keys) == len(previous["clips"]):
+                print(f"[VIDEO MERGE] Timeline unchanged for user {user_id}, reusing {previous['output_url']}")
+                return previous["output_url"], 0
+            if prefix < MIN_REUSED_PREFIX or not os.path.exists(previous["output_path"]):
+                prefix = 0
+
+        output_path = self.segment_cache_service.new_output_path()
+        with self.segment_cache_service.pinned([previous["output_path"]] if prefix else []):
+            # clip durations give the cut points for the next merge, the reused prefix is already known
+            durations = previous["durations"][:prefix] if prefix else []
+            with span("ffmpeg", "probe"):
+                durations += await asyncio.gather(*(self._probe_duration(path) for path in video_inputs[prefix:]))
+
+            if prefix:
+                print(f"[VIDEO MERGE] Reusing {prefix}/{len(keys)} clips from the previous merge for user {user_id}")
+                entries = [(previous["output_path"], sum(durations[:prefix]))] + [(path, None) for path in video_inputs[prefix:]]
+            else:
+                entries = [(path, None) for path in video_inputs]
+
+            # ffmpeg and the upload run as one stream, so they are timed together
+            with span("ffmpeg", "concat_upload"):
+                async with aclosing(self._tee_to_file(self._merge_with_ffmpeg_http(entries), output_path)) as chunks:
+                    public_url, merged_size = await self.storage_service.upload_stream(video_path, chunks)
+
+        if all(duration is not None for duration in durations):
+            await self._save_manifest(user_id, {
+                "clips": keys,
+                "durations": durations,
+                "output_path": output_path,
+                "output_url": public_url,
+            })
+        return public_url, merged_size
+
+    def _manifest_key(self, user_id: str) -> str:
+        return f"merge:manifest:{user_id}"
+
+    async def _load_manifest(self, user_id: str) -> Optional[dict]:
         try:
-            # Merge videos using FFmpeg with HTTP inputs directly
-            merge_start = time.time()
-            
-            merged_video_data = await self._merge_with_ffmpeg_http(video_urls)
-            
-            merge_duration = time.time() - merge_start
-            merged_size = len(merged_video_data)
-            
-            # Upload to storage
-            upload_start = time.time()
-            video_id = str(uuid.uuid4())
-            video_path = f"videos/{user_id}/merged_{video_id}.mp4"
-            
-            public_url = await self.storage_service.upload_file(video_path, merged_video_data)
-            
-            upload_duration = time.time() - upload_start
-            total_duration = time.time() - start_time
-            
-            return public_url
+            data = await self.redis_service.client.get(self._manifest_key(user_id))
+            return codec.decode(data) if data else None
         except Exception as e:
-            raise
+            # a missing manifest only costs a full merge
+            print(f"Failed to load merge manifest for user {user_id}: {e}")
+            return None
+
+    async def _save_manifest(self, user_id: str, manifest: dict):
+        try:
+            await self.redis_service.client.set(
+                self._manifest_key(user_id), codec.encode(manifest), ex=settings.MERGE_MANIFEST_TTL
+            )
+        except Exception as e:
+            print(f"Failed to save merge manifest for user {user_id}: {e}")
 
-    async def _merge_with_ffmpeg_http(self, video_urls: list[str]) -> bytes:
+    async def _probe_duration(self, path: str) -> Optional[float]:
+        """Container duration in seconds via ffprobe, None if it can't be read"""
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+        try:
+            return float(stdout.decode().strip())
+        except ValueError:
+            return None
+
+    async def _tee_to_file(self, chunks: AsyncIterator[bytes], path: str) -> AsyncIterator[bytes]:
+        """Pass chunks through while keeping a local copy at `path`, which only appears once the stream completed"""
+        tmp_path = f"{path}.part"
+        try:
+            with open(tmp_path, "wb") as f:
+                async with aclosing(chunks):
+                    async for chunk in chunks:
+                        await asyncio.to_thread(f.write, chunk)
+                        yield chunk
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _merge_with_ffmpeg_http(self, video_inputs: list) -> AsyncIterator[bytes]:
         """
-        Merges videos using FFmpeg with HTTP inputs directly.
+        Merges videos using FFmpeg and yields the merged MP4 as it is produced.
+        Inputs are local paths (segment cache) or HTTP URLs, which FFmpeg reads directly.
+        An input may also be a (path, outpoint) pair, to take only its first `outpoint` seconds.
         FFmpeg downloads and merges in one pass - no temporary files, no intermediate downloads.
         Uses concat demuxer with HTTP URLs for maximum speed.
         
@@ -73,13 +308,21 @@ class VideoMergeService:
         1. Create concat file content in memory (as string)
         2. Pipe concat file to FFmpeg via stdin
         3. FFmpeg reads videos directly from HTTP URLs
-        4. Stream output directly to stdout
+        4. Yield stdout chunks as they arrive (fragmented MP4, so no seeking back is needed)
+
+        Raises after the last chunk if FFmpeg exits with an error, so a consumer never commits a broken file.
         """
         # Build concat file content in memory
         # Format: file 'http://url1'
         #         file 'http://url2'
         #         ...
-        concat_content = "".join([f"file '{url}'\n" for url in video_urls])
+        concat_lines = []
+        for video_input in video_inputs:
+            url, outpoint = video_input if isinstance(video_input, tuple) else (video_input, None)
+            concat_lines.append(f"file '{url}'\n")
+            if outpoint is not None:
+                concat_lines.append(f"outpoint {outpoint:.6f}\n")
+        concat_content = "".join(concat_lines)
         concat_bytes = concat_content.encode('utf-8')
         
         # FFmpeg command using concat demuxer with stdin for concat file
@@ -107,61 +350,41 @@ class VideoMergeService:
             stderr=asyncio.subprocess.PIPE
         )
         
-        # Write concat file to stdin first, then read output in parallel
-        async def write_concat_file():
-            """Write concat file content to FFmpeg stdin."""
-            try:
-                process.stdin.write(concat_bytes)
-                await process.stdin.drain()
-                process.stdin.close()
-                await process.stdin.wait_closed()
-            except Exception as e:
-                raise
-        
-        async def read_output():
-            """Read merged video output from FFmpeg stdout."""
-            chunks = []
-            try:
-                while True:
-                    chunk = await process.stdout.read(1024 * 1024)  # Read 1MB chunks
-                    if not chunk:
-                        break
-                    chunks.append(chunk)
-                return b"".join(chunks)
-            except Exception as e:
-                raise
-        
         async def monitor_progress():
-            """Monitor FFmpeg stderr for progress and errors."""
-            chunks = []
-            try:
-                while True:
-                    chunk = await process.stderr.read(1024)
-                    if not chunk:
-                        break
-                    chunks.append(chunk)
-            except Exception as e:
-                pass
-            
-            return b"".join(chunks)
+            """Drain FFmpeg stderr (so it never blocks on a full pipe), keeping only the tail for errors."""
+            tail = bytearray()
+            while True:
+                chunk = await process.stderr.read(1024)
+                if not chunk:
+                    break
+                tail.extend(chunk)
+                del tail[:-STDERR_TAIL_BYTES]
+            return bytes(tail)
 
-        # Write concat file first, then read output and monitor progress in parallel
+        stderr_task = asyncio.create_task(monitor_progress())
         try:
-            await write_concat_file()
-            stdout_data, stderr_data = await asyncio.gather(
-                read_output(),
-                monitor_progress()
-            )
-        except Exception as e:
-            process.terminate()
-            await process.wait()
-            raise Exception(f"Error during FFmpeg execution: {e}")
-        
-        # Wait for process to complete
-        return_code = await process.wait()
+            # Write concat file to stdin first, then stream the output
+            process.stdin.write(concat_bytes)
+            await process.stdin.drain()
+            process.stdin.close()
+            await process.stdin.wait_closed()
 
-        if return_code != 0:
-            error_msg = stderr_data.decode() if stderr_data else "Unknown FFmpeg error"
-            raise Exception(f"FFmpeg failed with return code {return_code}: {error_msg}")
-        
-        return stdout_data
+            while True:
+                chunk = await process.stdout.read(settings.MERGE_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+            # Wait for process to complete
+            return_code = await process.wait()
+            stderr_data = await stderr_task
+
+            if return_code != 0:
+                error_msg = stderr_data.decode(errors="replace") if stderr_data else "Unknown FFmpeg error"
+                raise Exception(f"FFmpeg failed with return code {return_code}: {error_msg}")
+        finally:
+            # consumer gave up (upload failed, request cancelled): don't leave ffmpeg running
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            stderr_task.cancel()
@@ -0,0 +1,92 @@
+"""
+Compact, pickle-free codec for the small records we keep in Redis.
+
+Every encoded value starts with a one byte version header:
+    0x01  orjson
+    0x02  orjson, zstd compressed (only above CODEC_ZSTD_THRESHOLD bytes and
+          only when the optional `zstandard` package is installed)
+
+The old lzma+pickle format is not read at all: nothing written in it lives
+under the current keys, and unpickling Redis values would run arbitrary code.
+"""
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import orjson
+
+from utils.env import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+class Codec(ABC):
+    version: int
+
+    @abstractmethod
+    def dumps(self, data: dict) -> bytes: ...
+
+    @abstractmethod
+    def loads(self, payload: bytes) -> dict: ...
+
+
+class JsonCodec(Codec):
+    version = 0x01
+
+    def dumps(self, data: dict) -> bytes:
+        return orjson.dumps(data)
+
+    def loads(self, payload: bytes) -> dict:
+        return orjson.loads(payload)
+
+
+class ZstdJsonCodec(Codec):
+    version = 0x02
+
+    def __init__(self, level: int = 3):
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def dumps(self, data: dict) -> bytes:
+        return self.compress(orjson.dumps(data))
+
+    def compress(self, payload: bytes) -> bytes:
+        """Compress JSON that is already serialized"""
+        return self.compressor.compress(payload)
+
+    def loads(self, payload: bytes) -> dict:
+        return orjson.loads(self.decompressor.decompress(payload))
+
+
+_codecs: dict[int, Codec] = {}
+
+
+def register_codec(codec: Codec):
+    if not 0 < codec.version <= 0xFF:
+        raise ValueError(f"Invalid codec version: {codec.version}")
+    _codecs[codec.version] = codec
+
+
+register_codec(JsonCodec())
+if zstandard is not None:
+    register_codec(ZstdJsonCodec())
+
+
+def encode(data: dict) -> bytes:
+    """Encode a dict with the versioned header, compressing only when it pays off"""
+    payload = _codecs[JsonCodec.version].dumps(data)
+    if zstandard is not None and len(payload) > settings.CODEC_ZSTD_THRESHOLD:
+        return bytes([ZstdJsonCodec.version]) + _codecs[ZstdJsonCodec.version].compress(payload)
+    return bytes([JsonCodec.version]) + payload
+
+
+def decode(data: bytes) -> Optional[dict]:
+    """Decode a value written by encode()"""
+    if not data:
+        return None
+    codec = _codecs.get(data[0])
+    if codec is None:
+        raise ValueError(f"Unknown codec version: {data[0]:#04x}")
+    return codec.loads(data[1:])
@@ -6,9 +6,89 @@ class Settings(BaseSettings):
     GOOGLE_GENAI_USE_VERTEXAI: bool
     GOOGLE_CLOUD_BUCKET_NAME: str
     REDIS_URL: str
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0  # seconds to wait for a free pooled connection
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 5.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    JOB_WORKER_IN_PROCESS: bool = True  # also consume the job queue inside the web process (local dev / single container)
+    JOB_WORKER_CONCURRENCY: int = 8  # jobs processed at once per worker
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_QUEUE_VISIBILITY_TIMEOUT: float = 60.0  # seconds before an unacknowledged job is handed to another worker
+    JOB_QUEUE_BLOCK_MS: int = 2000  # keep below REDIS_SOCKET_TIMEOUT
+    JOB_QUEUE_MAXLEN: int = 10000
+    JOB_QUEUE_TTL: int = 3600  # how long an unfinished job and its input are kept, above the stage budget of an attempt
+    JOB_POLLER_INTERVAL: float = 1.0  # seconds between scans for due operations
+    JOB_POLLER_BATCH_SIZE: int = 50
+    JOB_POLL_INITIAL_DELAY: float = 5.0  # first Vertex poll, doubled after each miss
+    JOB_POLL_MAX_DELAY: float = 30.0
+    JOB_EVENTS_KEEPALIVE: float = 15.0  # seconds between keep-alives on job event streams
+    JOB_STAGE_RETRIES: int = 2  # retries of each Gemini stage within one job attempt
+    JOB_STAGE_RETRY_DELAY: float = 2.0
+    JOB_STAGE_TIMEOUT: float = 420.0  # per stage attempt, above VERTEX_QUEUE_TIMEOUT so queued calls aren't cut off
+    JOB_GEMINI_STAGE_CONCURRENCY: int = 0  # Gemini stages running at once per process, 0 = no cap (VERTEX_RATE_LIMITS paces them)
+    JOB_VEO_STAGE_CONCURRENCY: int = 0  # Veo submissions running at once per process, 0 = no cap (VERTEX_RATE_LIMITS paces them)
+    JOB_STATUS_BATCH_MAX: int = 100  # job ids per POST /api/jobs/video/status
+    JOB_COALESCE: bool = True  # identical submissions share one in-flight job and reuse recent results
+    JOB_RESULT_INDEX_TTL: int = 24 * 3600  # how long a finished video is handed out for identical submissions
+    GEMINI_CACHE_ENABLED: bool = True
+    GEMINI_CACHE_TTL: int = 86400  # seconds, local LRU and Redis
+    GEMINI_CACHE_LOCAL_MAX_ITEMS: int = 256
+    GEMINI_CACHE_LOCAL_MAX_BYTES: int = 64 * 1024 * 1024
+    GEMINI_CACHE_MAX_ITEM_BYTES: int = 8 * 1024 * 1024  # larger results are only cached locally
+    VERTEX_RATE_LIMIT_ENABLED: bool = True
+    VERTEX_RATE_LIMITS: dict[str, float] = {  # requests per minute per model, shared by all replicas (JSON in env)
+        "veo-3.1-fast-generate-001": 10,
+        "gemini-2.5-flash-image": 60,
+        "gemini-2.0-flash": 300,
+    }
+    VERTEX_RATE_LIMIT_BURST_SECONDS: float = 10.0  # bucket capacity, in seconds worth of tokens
+    VERTEX_QUEUE_TIMEOUT: float = 300.0  # longest a call waits for quota
+    VERTEX_MAX_RETRIES: int = 4  # retries after a 429
+    VERTEX_RETRY_BASE_DELAY: float = 2.0
+    BILLING_TYPE_CACHE_TTL: float = 300.0  # seconds a user's free/paid plan is cached for scheduling
+    MERGE_MAX_CONCURRENT: int = 0  # concurrent ffmpeg processes, 0 = number of cores
+    MERGE_MAX_QUEUE: int = 32  # merges waiting for a slot before we answer 503
+    MERGE_MAX_QUEUED_PER_USER: int = 3  # waiting merges per user before we answer 429
+    SEGMENT_CACHE_DIR: str = ""  # empty = <tmp>/flowboard-segments
+    SEGMENT_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    SEGMENT_CACHE_PREFETCH_CONCURRENCY: int = 4
+    MERGE_READ_CHUNK_SIZE: int = 1024 * 1024  # bytes read from ffmpeg stdout at a time
+    MERGE_INCREMENTAL: bool = True  # reuse the unchanged prefix of the user's previous merge
+    MERGE_MANIFEST_TTL: int = 7 * 24 * 3600
+    GCS_UPLOAD_CHUNK_SIZE: int = 8 * 1024 * 1024  # resumable upload chunk, must be a multiple of 256 KiB
+    UPLOAD_MAX_IMAGE_BYTES: int = 10 * 1024 * 1024  # per image on image/video job endpoints
+    UPLOAD_MAX_VIDEO_BYTES: int = 100 * 1024 * 1024  # /api/gemini/extract-context
+    UPLOAD_SPOOL_THRESHOLD: int = 1024 * 1024  # uploads above this are spooled to a temp file
+    GEMINI_INLINE_MAX_BYTES: int = 8 * 1024 * 1024  # larger media is uploaded to the bucket and passed by gs:// URI
+    IMAGE_NORMALIZE_ENABLED: bool = True  # resize / 16:9 / re-encode images before Gemini and Veo calls
+    IMAGE_MAX_WIDTH: int = 1920
+    IMAGE_MAX_HEIGHT: int = 1080
+    IMAGE_FIT: str = "letterbox"  # or "crop"
+    IMAGE_JPEG_QUALITY: int = 90
+    IMAGE_PASSTHROUGH_MAX_BYTES: int = 2 * 1024 * 1024  # fitting PNG/JPEG images up to this size are sent as they are
+    IMAGE_PROCESS_WORKERS: int = 2  # processes doing the resizing
+    OTEL_ENABLED: bool = False  # export traces over OTLP, needs opentelemetry-sdk + opentelemetry-exporter-otlp
+    OTEL_SERVICE_NAME: str = "flowboard-backend"
+    WORKER_METRICS_PORT: int = 0  # serve /metrics from worker.py on this port, 0 = off
+    CODEC_ZSTD_THRESHOLD: int = 4096  # bytes of JSON before zstd kicks in (needs `zstandard`)
     SUPABASE_URL: str
     SUPABASE_SECRET_KEY: str
+    SUPABASE_MAX_CONNECTIONS: int = 20
+    SUPABASE_TIMEOUT: float = 10.0
+    SUPABASE_JWT_SECRET: str = ""  # legacy HS256 secret, needed to verify HS256 tokens locally
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL: float = 300.0  # upper bound, entries never outlive the token's exp
+    AUTH_INVALID_TOKEN_CACHE_TTL: float = 30.0
+    AUTH_JWKS_TTL: int = 600  # seconds signing keys are cached before JWKS is fetched again
     AUTUMN_SECRET_KEY: str
+    AUTUMN_TIMEOUT: float = 10.0
+    AUTUMN_MAX_CONNECTIONS: int = 20
+    AUTUMN_MAX_RETRIES: int = 2
+    AUTUMN_RETRY_BASE_DELAY: float = 0.2  # seconds, doubled per attempt with full jitter
+    AUTUMN_CACHE_TTL: float = 30.0  # proxied customer/product GETs, 0 disables the cache
+    BILLING_EVENT_TTL: int = 7 * 24 * 3600  # webhook event ids remembered for deduplication
+    BILLING_GRANT_ATTEMPTS: int = 5
     FRONTEND_URL: str = "http://localhost:5173"  # Default for local dev
     model_config = SettingsConfigDict(
         env_file=".env",
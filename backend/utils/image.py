@@ -0,0 +1,63 @@
+import io
+from PIL import Image, UnidentifiedImageError
+
+# formats sent as-is when they already fit, everything else is re-encoded
+PASSTHROUGH_FORMATS = {"PNG": "image/png", "JPEG": "image/jpeg"}
+TARGET_ASPECT = 16 / 9
+# Gemini's own 16:9 output is 1344x768 (1.75), close enough not to be letterboxed again
+ASPECT_TOLERANCE = 0.02
+
+def normalize_image(
+    data: bytes, max_width: int, max_height: int, fit: str = "letterbox", quality: int = 90, passthrough_max_bytes: int = 2 * 1024 * 1024
+) -> tuple[bytes, str]:
+    """
+    Prepare an image for Gemini / Veo: sniff its real format, scale it down to fit max_width x max_height,
+    letterbox (or crop, fit="crop") it to 16:9 and re-encode it as JPEG. Small PNG/JPEG images that already
+    fit are returned untouched. Returns (bytes, mime type).
+
+    Pure CPU work without any app imports, so it can run in a process pool (see VertexService).
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        # not something Pillow reads, let the model decide
+        return data, "image/png"
+
+    width, height = image.size
+    fits = width <= max_width and height <= max_height and len(data) <= passthrough_max_bytes
+    if fits and abs(width / height - TARGET_ASPECT) <= TARGET_ASPECT * ASPECT_TOLERANCE and image.format in PASSTHROUGH_FORMATS:
+        return data, PASSTHROUGH_FORMATS[image.format]
+
+    image.load()
+    if image.mode in ("RGBA", "LA", "P"):
+        # canvas exports are often transparent, flatten onto white like the board shows them
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if fit == "crop":
+        # cut the longer side down to 16:9 around the centre
+        if width / height > TARGET_ASPECT:
+            crop_width = round(height * TARGET_ASPECT)
+            left = (width - crop_width) // 2
+            image = image.crop((left, 0, left + crop_width, height))
+        else:
+            crop_height = round(width / TARGET_ASPECT)
+            top = (height - crop_height) // 2
+            image = image.crop((0, top, width, top + crop_height))
+        image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+    else:
+        image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+        width, height = image.size
+        canvas_width, canvas_height = max(width, round(height * TARGET_ASPECT)), max(height, round(width / TARGET_ASPECT))
+        if (canvas_width, canvas_height) != (width, height):
+            canvas = Image.new("RGB", (canvas_width, canvas_height), (0, 0, 0))
+            canvas.paste(image, ((canvas_width - width) // 2, (canvas_height - height) // 2))
+            image = canvas
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), "image/jpeg"
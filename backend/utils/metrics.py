@@ -0,0 +1,111 @@
+import functools
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from opentelemetry import trace
+from utils.env import settings
+
+# seconds; dependency calls range from sub-millisecond Redis ops to minute-long merges
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled", ["method", "route"],
+    multiprocess_mode="livesum",
+)
+DEPENDENCY_LATENCY = Histogram(
+    "dependency_call_duration_seconds", "Latency of calls to Vertex, Redis, Supabase, Autumn and ffmpeg",
+    ["dependency", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+DEPENDENCY_IN_FLIGHT = Gauge(
+    "dependency_calls_in_flight", "Calls waiting on a dependency", ["dependency"],
+    multiprocess_mode="livesum",
+)
+JOB_DURATION = Histogram(
+    "video_job_duration_seconds", "Video job time from creation to done/error", ["status"],
+    buckets=(5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600),
+)
+STAGE_DURATION = Histogram(
+    "pipeline_stage_duration_seconds", "Run time of each pipeline stage (see utils/pipeline.py)", ["pipeline", "stage", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_WAIT = Histogram(
+    "pipeline_stage_wait_seconds", "Time pipeline stages queued for their semaphore", ["pipeline", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+MERGES_RUNNING = Gauge(
+    "video_merges_running", "ffmpeg merges holding a MergeScheduler slot",
+    multiprocess_mode="livesum",
+)
+MERGE_QUEUE_DEPTH = Gauge(
+    "video_merge_queue_depth", "Merges waiting for a MergeScheduler slot",
+    multiprocess_mode="livesum",
+)
+MERGE_WAIT = Histogram(
+    "video_merge_wait_seconds", "Time merges waited for a MergeScheduler slot",
+    buckets=LATENCY_BUCKETS,
+)
+MERGE_REJECTED = Counter(
+    "video_merges_rejected", "Merges turned away by the MergeScheduler", ["reason"],
+)
+
+# a no-op tracer unless init_tracing() installed an SDK provider
+tracer = trace.get_tracer("flowboard")
+
+@contextmanager
+def span(dependency: str, operation: str):
+    """Time a dependency call into DEPENDENCY_LATENCY, and trace it when OpenTelemetry is on"""
+    in_flight = DEPENDENCY_IN_FLIGHT.labels(dependency)
+    in_flight.inc()
+    outcome = "ok"
+    start = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(f"{dependency} {operation}"):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        DEPENDENCY_LATENCY.labels(dependency, operation, outcome).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+def traced(dependency: str):
+    """Decorator form of span() for coroutine methods, the operation is the method name"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(dependency, func.__name__):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def metrics_response() -> tuple[bytes, bytes]:
+    """(content type, body) of the Prometheus exposition, aggregated across processes when multiprocess mode is on"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return CONTENT_TYPE_LATEST.encode(), generate_latest(registry)
+
+def init_tracing():
+    """Export spans over OTLP when OTEL_ENABLED (needs opentelemetry-sdk and the OTLP exporter)"""
+    if not settings.OTEL_ENABLED:
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        print(f"Warning: OTEL_ENABLED but OpenTelemetry SDK is not installed: {e}")
+        return
+    # endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+    provider = TracerProvider(resource=Resource.create({"service.name": settings.OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+from blacksheep import Request
+from utils.env import settings
+
+# form fields are short text (prompts, context), anything bigger is rejected
+MAX_FIELD_BYTES = 64 * 1024
+# multipart boundaries, part headers and text fields on top of the files themselves
+BODY_OVERHEAD_BYTES = 1024 * 1024
+
+class UploadTooLargeError(Exception):
+    """Raised while reading a multipart body that exceeds the endpoint's limits, answered with 413"""
+
+class SpooledUpload:
+    """
+    An uploaded file, kept in memory up to UPLOAD_SPOOL_THRESHOLD bytes and spooled to a temp file beyond that.
+    Handed down instead of the raw bytes, consumers read it when (and if) they need the content.
+    """
+    def __init__(self, name: str, file_name: Optional[str], content_type: Optional[str]):
+        self.name = name
+        self.file_name = file_name
+        self.content_type = content_type
+        self.size = 0
+        # hashed while it streams in, so content-addressed storage doesn't need a second pass
+        self.sha256 = hashlib.sha256()
+        self.file = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_THRESHOLD)
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > settings.UPLOAD_SPOOL_THRESHOLD:
+            # on disk now, keep file IO off the event loop
+            await asyncio.to_thread(self._write, chunk)
+        else:
+            self._write(chunk)
+
+    def _write(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.file.write(chunk)
+
+    async def read(self) -> bytes:
+        def read_all():
+            self.file.seek(0)
+            return self.file.read()
+        return await asyncio.to_thread(read_all)
+
+    def close(self):
+        self.file.close()
+
+@dataclass
+class MultipartForm:
+    fields: dict[str, str] = field(default_factory=dict)
+    files: list[SpooledUpload] = field(default_factory=list)
+
+@asynccontextmanager
+async def read_multipart(request: Request, max_file_bytes: int, max_files: int = 1):
+    """
+    Parse a multipart/form-data body as it streams in, enforcing the limits while reading:
+    a body that can't fit is refused from its Content-Length, an oversized file is refused as soon
+    as it crosses `max_file_bytes`. Raises UploadTooLargeError. Uploads are deleted on exit.
+    """
+    content_length = request.headers.get_first(b"content-length")
+    if content_length and int(content_length) > max_files * max_file_bytes + BODY_OVERHEAD_BYTES:
+        raise UploadTooLargeError(f"Upload too large, files are limited to {max_file_bytes // (1024 * 1024)} MB")
+
+    form = MultipartForm()
+    try:
+        async for part in request.multipart_stream():
+            if part.file_name is None:
+                value = bytearray()
+                async for chunk in part.stream():
+                    value.extend(chunk)
+                    if len(value) > MAX_FIELD_BYTES:
+                        raise UploadTooLargeError(f"Form field {part.name} is too large")
+                form.fields[part.name] = value.decode(part.charset or "utf-8")
+                continue
+
+            if len(form.files) >= max_files:
+                raise UploadTooLargeError(f"At most {max_files} files can be uploaded")
+            upload = SpooledUpload(part.name, part.file_name, part.content_type)
+            form.files.append(upload)
+            async for chunk in part.stream():
+                await upload.write(chunk)
+                if upload.size > max_file_bytes:
+                    raise UploadTooLargeError(
+                        f"{part.file_name} is too large, files are limited to {max_file_bytes // (1024 * 1024)} MB"
+                    )
+        yield form
+    finally:
+        for upload in form.files:
+            upload.close()
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+from utils import codec
+from utils import metrics
+
+@dataclass
+class Stage:
+    """
+    One node of a Pipeline. `run` is called with the results of `depends_on` as keyword arguments
+    once they are all done; stages without a dependency between them run concurrently.
+    """
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    depends_on: tuple[str, ...] = ()
+    retries: int = 0  # extra attempts after a failure
+    retry_delay: float = 1.0  # doubled after every failed attempt
+    timeout: Optional[float] = None  # per attempt, not counting the wait for the semaphore
+    semaphore: Optional[asyncio.Semaphore] = None  # caps this stage across every pipeline that shares it
+    checkpoint: bool = True  # save the result so a retried pipeline skips the stage
+
+class StageError(Exception):
+    """A stage failed after its retries, the original exception is __cause__"""
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"{stage} failed: {str(error) or type(error).__name__}")
+        self.stage = stage
+
+class RedisCheckpoint:
+    """
+    Stage results in one Redis hash, so the next attempt of a pipeline resumes after its last completed stage.
+    bytes are stored as they are, other results through utils/codec.
+    """
+    # codec headers start at 0x01, so a zero byte can tag raw bytes
+    BYTES_TAG = b"\x00"
+
+    def __init__(self, redis_client, key: str, ttl: int):
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl = ttl
+
+    async def load(self) -> dict[str, Any]:
+        raw = await self.redis_client.hgetall(self.key)
+        results = {}
+        for stage, value in raw.items():
+            if value[:1] == self.BYTES_TAG:
+                results[stage.decode()] = value[1:]
+            else:
+                results[stage.decode()] = codec.decode(value)["value"]
+        return results
+
+    async def save(self, stage: str, result: Any):
+        value = self.BYTES_TAG + result if isinstance(result, bytes) else codec.encode({"value": result})
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.key, stage, value)
+            pipe.expire(self.key, self.ttl)
+            await pipe.execute()
+
+    async def clear(self):
+        await self.redis_client.delete(self.key)
+
+class Pipeline:
+    """
+    Runs a set of stages as a dependency graph: every stage starts as soon as its dependencies are done,
+    with its own retries, timeout and semaphore. Run time (all attempts, without retry backoff) goes to `durations` and
+    pipeline_stage_duration_seconds, time queued for the semaphore to `waits` and pipeline_stage_wait_seconds.
+    The first stage that fails for good cancels the rest.
+    """
+    def __init__(self, name: str, stages: list[Stage], checkpoint: Optional[RedisCheckpoint] = None):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        self.checkpoint = checkpoint
+        self.results: dict[str, Any] = {}
+        self.durations: dict[str, float] = {}
+        self.waits: dict[str, float] = {}
+        for stage in stages:
+            missing = [dep for dep in stage.depends_on if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        done, visiting = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline {self.name} has a dependency cycle through {name}")
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self) -> dict[str, Any]:
+        """Run every stage (skipping the ones already checkpointed) and return all results by stage name"""
+        if self.checkpoint:
+            self.results.update({
+                name: result for name, result in (await self.checkpoint.load()).items() if name in self.stages
+            })
+
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage):
+            inputs = {dep: await tasks[dep] for dep in stage.depends_on}
+            if stage.name in self.results:
+                return self.results[stage.name]
+            result = await self._run_stage(stage, inputs)
+            self.results[stage.name] = result
+            if self.checkpoint and stage.checkpoint:
+                await self.checkpoint.save(stage.name, result)
+            return result
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.create_task(run_stage(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return self.results
+
+    async def _run_stage(self, stage: Stage, inputs: dict[str, Any]) -> Any:
+        self.durations[stage.name] = 0.0
+        if stage.semaphore:
+            self.waits[stage.name] = 0.0
+        outcome = "error"
+        try:
+            with metrics.tracer.start_as_current_span(f"{self.name} {stage.name}"):
+                result = await self._retry(stage, inputs)
+            outcome = "ok"
+            return result
+        finally:
+            metrics.STAGE_DURATION.labels(self.name, stage.name, outcome).observe(self.durations[stage.name])
+            if stage.semaphore:
+                metrics.STAGE_WAIT.labels(self.name, stage.name).observe(self.waits[stage.name])
+
+    async def _retry(self, stage: Stage, inputs: dict[str, Any]) -> Any:
+        delay = stage.retry_delay
+        for attempt in range(stage.retries + 1):
+            try:
+                return await self._attempt(stage, inputs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= stage.retries:
+                    raise StageError(stage.name, e) from e
+                print(f"{self.name} stage {stage.name} failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}")
+            # back off without holding the semaphore, other pipelines can use the slot meanwhile
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    async def _attempt(self, stage: Stage, inputs: dict[str, Any]) -> Any:
+        if not stage.semaphore:
+            return await self._timed_run(stage, inputs)
+        queued = time.perf_counter()
+        async with stage.semaphore:
+            self.waits[stage.name] += time.perf_counter() - queued
+            return await self._timed_run(stage, inputs)
+
+    async def _timed_run(self, stage: Stage, inputs: dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(stage.run(**inputs), stage.timeout)
+        finally:
+            self.durations[stage.name] += time.perf_counter() - start
@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """
+    Small in-process LRU with per-entry expiry.
+    Bounded by item count and, optionally, by the total len() of the cached values.
+    Not thread-safe; it is meant to be used from the event loop.
+    """
+    def __init__(self, max_items: int, ttl: float, max_bytes: Optional[int] = None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sizeof(self, value: Any) -> int:
+        return len(value) if self.max_bytes is not None and isinstance(value, (bytes, str)) else 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Cache `value`; `ttl` overrides the default expiry for this entry"""
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self.pop(key)
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.size_bytes += size
+        while len(self._entries) > self.max_items or (self.max_bytes is not None and self.size_bytes > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size_bytes -= self._sizeof(evicted)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.size_bytes -= self._sizeof(entry[1])
+        return entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
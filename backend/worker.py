@@ -0,0 +1,48 @@
+import asyncio
+import os
+import signal
+import socket
+from prometheus_client import start_http_server
+from services.redis_service import RedisService
+from services.storage_service import StorageService
+from services.vertex_service import VertexService
+from services.vertex_rate_limiter import VertexRateLimiter
+from services.gemini_cache_service import GeminiCacheService
+from services.job_queue_service import JobQueueService
+from services.job_service import JobService
+from utils import metrics
+from utils.env import settings
+
+async def run_worker():
+    """
+    Standalone job worker: consumes the video job queue and polls Veo operations.
+    Scale these independently of the HTTP tier (set JOB_WORKER_IN_PROCESS=false on the web processes).
+    """
+    redis_service = RedisService()
+    vertex_service = VertexService(GeminiCacheService(redis_service), StorageService(), VertexRateLimiter(redis_service))
+    job_queue_service = JobQueueService(redis_service)
+    job_service = JobService(vertex_service, redis_service, job_queue_service)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    metrics.init_tracing()
+    if settings.WORKER_METRICS_PORT:
+        # the worker has no HTTP app, expose its dependency metrics on a side port
+        start_http_server(settings.WORKER_METRICS_PORT)
+
+    await redis_service.start()
+    consumer = f"worker-{socket.gethostname()}-{os.getpid()}"
+    await job_service.start_worker(consumer)
+    print(f"Job worker {consumer} started")
+
+    await stop.wait()
+
+    await job_service.stop()
+    await redis_service.stop()
+    await vertex_service.close()
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())